@@ -2,10 +2,27 @@
 from db_config import session_scope
 from models import User, Product, Order, OrderItem
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import select, desc
+from sqlalchemy import select, desc, insert
 from sqlalchemy import func
 from collections import defaultdict
 from sqlalchemy.orm import selectinload
+from itertools import islice
+
+DEFAULT_BATCH_SIZE = 1000
+
+def _batches(rows, batch_size):
+    """Split an iterable into lists of at most ``batch_size`` items."""
+    iterator = iter(rows)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+def _insert_in_batches(session, model, rows, batch_size):
+    """Insert dict rows with one executemany per batch; return the row count."""
+    count = 0
+    for batch in _batches(rows, batch_size):
+        session.execute(insert(model), batch)
+        count += len(batch)
+    return count
 
 # User CRUD
 def add_user(name, email):
@@ -192,3 +209,96 @@ def get_products_paginated(page: int = 1, per_page: int = 3):
             }
             for item in results
         ]
+
+def get_products_after(last_id: int = 0, per_page: int = 3):
+    """
+    Retrieve the page of order items that follows ``last_id`` (keyset pagination).
+
+    Unlike ``get_products_paginated`` this seeks on the primary key instead of
+    skipping ``OFFSET`` rows, so every page costs the same however deep it is.
+
+    Args:
+        last_id (int): The ``id`` of the last order item already seen (0 to start).
+        per_page (int): Number of records per page.
+
+    Returns:
+        List[dict]: Up to ``per_page`` order item dictionaries with ``id > last_id``.
+    """
+    with session_scope() as session:
+        stmt = (
+            select(OrderItem)
+            .options(selectinload(OrderItem.product))
+            .where(OrderItem.id > last_id)
+            .order_by(OrderItem.id)
+            .limit(per_page)
+        )
+        results = session.execute(stmt).scalars().all()
+
+        return [
+            {
+                'id': item.id,
+                'order_id': item.order_id,
+                'product_id': item.product_id,
+                'product_name': item.product.name,
+                'quantity': item.quantity
+            }
+            for item in results
+        ]
+
+def iter_products(per_page: int = 100):
+    """
+    Yield every order item dictionary in ``id`` order, one keyset page at a time.
+
+    Args:
+        per_page (int): Number of records fetched per query.
+    """
+    last_id = 0
+    while True:
+        page = get_products_after(last_id=last_id, per_page=per_page)
+        yield from page
+        if len(page) < per_page:
+            return
+        last_id = page[-1]['id']
+
+# Bulk writes: one transaction, one executemany per batch
+def add_users_bulk(users, batch_size=DEFAULT_BATCH_SIZE):
+    """Add many users from ``(name, email)`` pairs; all or nothing."""
+    try:
+        with session_scope() as session:
+            count = _insert_in_batches(
+                session, User, ({'name': name, 'email': email} for name, email in users), batch_size
+            )
+            return f'{count} users added.'
+    except IntegrityError:
+        return 'One or more emails already exist; no users added.'
+
+def add_products_bulk(products, batch_size=DEFAULT_BATCH_SIZE):
+    """Add many products from ``(name, price)`` pairs."""
+    with session_scope() as session:
+        count = _insert_in_batches(
+            session, Product, ({'name': name, 'price': price} for name, price in products), batch_size
+        )
+        return f'{count} products added.'
+
+def add_orders_bulk(user_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """Create one order per user ID; return the new order IDs in the same order."""
+    order_ids = []
+    with session_scope() as session:
+        stmt = insert(Order).returning(Order.id, sort_by_parameter_order=True)
+        for batch in _batches(({'user_id': user_id} for user_id in user_ids), batch_size):
+            order_ids.extend(session.scalars(stmt, batch))
+    return order_ids
+
+def add_order_items_bulk(items, batch_size=DEFAULT_BATCH_SIZE):
+    """Add many order items from ``(order_id, product_id, quantity)`` triples."""
+    with session_scope() as session:
+        count = _insert_in_batches(
+            session,
+            OrderItem,
+            (
+                {'order_id': order_id, 'product_id': product_id, 'quantity': quantity}
+                for order_id, product_id, quantity in items
+            ),
+            batch_size,
+        )
+        return f'{count} order items added.'
@@ -1,4 +1,4 @@
-from crud import add_user, add_product, add_order, add_order_item
+from crud import add_users_bulk, add_products_bulk, add_orders_bulk, add_order_items_bulk
 from db_config import set_session
 
 set_session('sqlite:///e5.db')
@@ -17,8 +17,7 @@ def add_sample_data():
         ("Ivan", "ivan@example.com"),
         ("Judy", "judy@example.com")
     ]
-    for name, email in user_data:
-        add_user(name, email)
+    add_users_bulk(user_data)
 
     # Adding products
     product_data = [
@@ -33,12 +32,10 @@ def add_sample_data():
         ("Webcam", 60),
         ("Headphones", 80)
     ]
-    for name, price in product_data:
-        add_product(name, price)
+    add_products_bulk(product_data)
 
     # Adding orders
-    for i in range(1, 11):
-        add_order(i)
+    add_orders_bulk(range(1, 11))
 
     # Adding order_items
     order_item_data = [
@@ -63,8 +60,7 @@ def add_sample_data():
         (10, 9, 1),
         (10, 10, 1)
     ]
-    for order_id, product_id, quantity in order_item_data:
-        add_order_item(order_id, product_id, quantity)
+    add_order_items_bulk(order_item_data)
 
 
 add_sample_data()
\ No newline at end of file
@@ -2,6 +2,7 @@ import pytest
 from sqlalchemy.future import select
 from models import Base, User, Product, Order, OrderItem
 from crud import get_all_users, add_user, get_user, add_product, get_product, add_order, add_order_item, delete_user
+from crud import get_products_after, get_products_paginated, iter_products
 from db_config import set_session
 
 @pytest.fixture(scope='function')
@@ -102,4 +103,19 @@ def test_delete_user(test_session):
     test_session.commit()
 
     result = delete_user(user.id)
-    assert 'User 1 deleted.' == result
\ No newline at end of file
+    assert 'User 1 deleted.' == result
+
+def test_keyset_pagination(test_session):
+    user = User(name='Frank', email='frank@example.com')
+    product = Product(name='Mouse', price=25)
+    test_session.add_all([user, product])
+    test_session.commit()
+    order_id = add_order(user.id)
+    for quantity in range(1, 8):
+        add_order_item(order_id, product.id, quantity)
+
+    first = get_products_after(last_id=0, per_page=3)
+    second = get_products_after(last_id=first[-1]['id'], per_page=3)
+    assert [item['quantity'] for item in first + second] == [1, 2, 3, 4, 5, 6]
+    assert second == get_products_paginated(page=2, per_page=3)
+    assert [item['quantity'] for item in iter_products(per_page=3)] == list(range(1, 8))
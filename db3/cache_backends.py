@@ -0,0 +1,201 @@
+"""Second-tier (L2) stores that an InstrumentedCache can read and write through to."""
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+
+try:
+    import redis
+except ImportError:  # optional, only needed for redis:// URLs
+    redis = None
+
+# Values at least this large are zlib-compressed before they are stored.
+COMPRESS_THRESHOLD = 512
+_RAW, _ZLIB = b'\x00', b'\x01'
+
+
+def dumps(value, tags=()):
+    """Serialize a cache value and its dependency tags into a compact blob."""
+    data = pickle.dumps((value, tuple(tags)), protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) >= COMPRESS_THRESHOLD:
+        return _ZLIB + zlib.compress(data)
+    return _RAW + data
+
+
+def loads(blob):
+    """Inverse of dumps(); returns ``(value, tags)``."""
+    data = blob[1:]
+    if blob[:1] == _ZLIB:
+        data = zlib.decompress(data)
+    return pickle.loads(data)
+
+
+def encode_key(key):
+    """Stable text form of a cache key (ints, strings and tuples of them)."""
+    return repr(tuple(key)) if isinstance(key, tuple) else repr(key)
+
+
+class SQLiteBackend:
+    """
+    L2 store kept in a local SQLite file, shareable between worker processes.
+
+    Expired entries are skipped by get() and deleted, with their tags, by
+    purge_expired(), which set() runs at most every ``purge_interval`` seconds.
+    """
+
+    def __init__(self, path, namespace, purge_interval=60):
+        self.namespace = namespace
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            namespace TEXT,
+            key TEXT,
+            value BLOB,
+            expires REAL,
+            PRIMARY KEY (namespace, key)
+        )
+        ''')
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_tags (
+            namespace TEXT,
+            tag TEXT,
+            key TEXT,
+            PRIMARY KEY (namespace, tag, key)
+        )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries (expires)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_tags_key ON cache_tags (namespace, key)')
+
+    def get(self, key):
+        """Return ``(value, tags)`` for ``key``, or None if missing or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires FROM cache_entries WHERE namespace = ? AND key = ?',
+                (self.namespace, encode_key(key)),
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return loads(row[0])
+
+    def set(self, key, value, tags, ttl):
+        encoded = encode_key(key)
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN')
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires) VALUES (?, ?, ?, ?)',
+                (self.namespace, encoded, dumps(value, tags), time.time() + ttl),
+            )
+            self._conn.execute(
+                'DELETE FROM cache_tags WHERE namespace = ? AND key = ?', (self.namespace, encoded)
+            )
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO cache_tags (namespace, tag, key) VALUES (?, ?, ?)',
+                [(self.namespace, encode_key(tag), encoded) for tag in tags],
+            )
+        if time.time() >= self._next_purge:
+            self.purge_expired()
+
+    def purge_expired(self):
+        """
+        Delete expired entries of every namespace, and tags left without an entry.
+
+        Returns:
+            int: The number of entries deleted.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN')
+            deleted = self._conn.execute('DELETE FROM cache_entries WHERE expires <= ?', (now,)).rowcount
+            self._conn.execute('''
+            DELETE FROM cache_tags WHERE NOT EXISTS (
+                SELECT 1 FROM cache_entries
+                WHERE cache_entries.namespace = cache_tags.namespace AND cache_entries.key = cache_tags.key
+            )
+            ''')
+        self._next_purge = now + self.purge_interval
+        return deleted
+
+    def invalidate(self, tags):
+        """Delete every entry that depends on any of ``tags``."""
+        params = [(self.namespace, encode_key(tag)) for tag in tags]
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN')
+            self._conn.executemany('''
+            DELETE FROM cache_entries WHERE namespace = ? AND key IN (
+                SELECT key FROM cache_tags WHERE namespace = cache_entries.namespace AND tag = ?
+            )
+            ''', params)
+            self._conn.executemany(
+                'DELETE FROM cache_tags WHERE namespace = ? AND tag = ?', params
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN')
+            self._conn.execute('DELETE FROM cache_entries WHERE namespace = ?', (self.namespace,))
+            self._conn.execute('DELETE FROM cache_tags WHERE namespace = ?', (self.namespace,))
+
+
+class RedisBackend:
+    """
+    L2 store on a Redis-protocol server.
+
+    ``client`` can be any object with the redis-py interface (for example a
+    fakeredis instance standing in for a local server).
+    """
+
+    def __init__(self, client, namespace):
+        self.client = client
+        self.namespace = namespace
+
+    def _entry(self, key):
+        return f'{self.namespace}:entry:{encode_key(key)}'
+
+    def _tag(self, tag):
+        return f'{self.namespace}:tag:{encode_key(tag)}'
+
+    def get(self, key):
+        blob = self.client.get(self._entry(key))
+        return loads(blob) if blob is not None else None
+
+    def set(self, key, value, tags, ttl):
+        entry = self._entry(key)
+        pipe = self.client.pipeline()
+        pipe.set(entry, dumps(value, tags), ex=max(1, int(ttl)))
+        for tag in tags:
+            pipe.sadd(self._tag(tag), entry)
+            pipe.expire(self._tag(tag), max(1, int(ttl)))
+        pipe.execute()
+
+    def invalidate(self, tags):
+        for tag in tags:
+            tag_key = self._tag(tag)
+            entries = self.client.smembers(tag_key)
+            self.client.delete(tag_key, *entries)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(f'{self.namespace}:*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def backend_from_url(url, namespace):
+    """
+    Build an L2 backend from a URL, or return None if ``url`` is empty.
+
+    Supported URLs: ``sqlite:///path/to/cache.db`` and ``redis://host:port/db``.
+    """
+    if not url:
+        return None
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):], namespace)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        if redis is None:
+            raise RuntimeError('The redis package is required for redis:// cache URLs.')
+        return RedisBackend(redis.Redis.from_url(url), namespace)
+    raise ValueError(f'Unsupported cache backend URL: {url!r}')
@@ -0,0 +1,337 @@
+"""Benchmark harness for the cached CRUD functions in crud_cache.py.
+
+Each scenario replays a generated key stream (uniform, Zipfian or hot-set)
+against one cached function, cached and uncached, with warm-up runs and
+repeats timed by perf_counter_ns. Results are summarized as a median with a
+bootstrap 95% confidence interval and can be written to JSON to compare runs
+across commits.
+
+Usage:
+    python cache_benchmark.py                          # every scenario x workload on a fresh temp DB
+    python cache_benchmark.py --scenario user_orders --workload zipf --calls 5000
+    python cache_benchmark.py --json after.json --compare before.json
+    python cache_benchmark.py --policies --calls 20000 --maxsize 50
+"""
+import argparse
+import bisect
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import crud_cache
+from cache_policies import POLICIES
+from cache_utils import InstrumentedCache
+from crud import add_users_bulk, add_products_bulk, add_orders_bulk, add_order_items_bulk
+from db_config import db
+
+
+# ---- Workloads: each returns ``calls`` keys drawn from range(1, key_space + 1) ----
+def uniform_keys(calls, key_space, rng):
+    return [rng.randint(1, key_space) for _ in range(calls)]
+
+
+def zipf_keys(calls, key_space, rng, s=1.1):
+    """Zipfian keys: key k is drawn with probability proportional to 1 / k**s."""
+    cumulative = list(itertools.accumulate(1 / k ** s for k in range(1, key_space + 1)))
+    total = cumulative[-1]
+    return [bisect.bisect_left(cumulative, rng.random() * total) + 1 for _ in range(calls)]
+
+
+def hot_set_keys(calls, key_space, rng, hot_fraction=0.1, hot_probability=0.9):
+    """``hot_probability`` of calls go to the first ``hot_fraction`` of the keys."""
+    hot = max(1, int(key_space * hot_fraction))
+    return [
+        rng.randint(1, hot) if rng.random() < hot_probability or hot == key_space
+        else rng.randint(hot + 1, key_space)
+        for _ in range(calls)
+    ]
+
+
+def zipf_scan_keys(calls, key_space, rng, scan_every=4):
+    """
+    Zipfian traffic polluted by batch scans that touch every key once.
+
+    After every ``scan_every`` blocks of Zipfian calls, one full pass over
+    the key space is inserted, like a nightly job walking all users.
+    """
+    keys = []
+    block = zipf_keys(max(1, key_space * scan_every), key_space, rng)
+    while len(keys) < calls:
+        keys.extend(block)
+        keys.extend(range(1, key_space + 1))
+        rng.shuffle(block)
+    return keys[:calls]
+
+
+WORKLOADS = {
+    'uniform': uniform_keys,
+    'zipf': zipf_keys,
+    'hot-set': hot_set_keys,
+    'zipf-scan': zipf_scan_keys,
+}
+
+
+# ---- Scenarios: one per cached function ----
+@dataclass
+class Scenario:
+    name: str
+    function: object      # the @cached function; .__wrapped__ is the uncached one
+    key_space: object     # callable(dataset) -> number of distinct keys
+    make_args: object     # callable(key, dataset) -> positional args
+
+    def call(self, key, dataset, cached=True):
+        fn = self.function if cached else self.function.__wrapped__
+        return fn(*self.make_args(key, dataset))
+
+
+PAGE_SIZE = 10
+
+SCENARIOS = {
+    scenario.name: scenario for scenario in (
+        Scenario('user_orders', crud_cache.get_user_orders_grouped,
+                 lambda d: d['users'], lambda key, d: (key,)),
+        Scenario('user_orders_json', crud_cache.get_user_orders_grouped_json,
+                 lambda d: d['users'], lambda key, d: (key,)),
+        Scenario('products_paginated', crud_cache.get_products_paginated,
+                 lambda d: max(1, d['order_items'] // PAGE_SIZE), lambda key, d: (key, PAGE_SIZE)),
+        Scenario('products_after', crud_cache.get_products_after,
+                 lambda d: max(1, d['order_items'] // PAGE_SIZE),
+                 lambda key, d: ((key - 1) * PAGE_SIZE, PAGE_SIZE)),
+        Scenario('total_quantity', crud_cache.get_total_quantity_per_product,
+                 lambda d: 20, lambda key, d: (key,)),
+        Scenario('all_products', crud_cache.get_all_products,
+                 lambda d: 1, lambda key, d: ()),
+    )
+}
+
+
+# ---- Statistics ----
+def bootstrap_ci(samples, confidence=0.95, resamples=1000, seed=0):
+    """Bootstrap confidence interval of the median of ``samples``."""
+    if len(samples) < 2:
+        return samples[0], samples[0]
+    rng = random.Random(seed)
+    medians = sorted(
+        statistics.median(rng.choices(samples, k=len(samples))) for _ in range(resamples)
+    )
+    tail = (1 - confidence) / 2
+    return medians[int(tail * resamples)], medians[int((1 - tail) * resamples) - 1]
+
+
+def summarize(samples_ns, calls):
+    """Summary of per-run durations in milliseconds, plus per-call latency in microseconds."""
+    samples_ms = [ns / 1e6 for ns in samples_ns]
+    median = statistics.median(samples_ms)
+    low, high = bootstrap_ci(samples_ms)
+    return {
+        'runs': len(samples_ms),
+        'median_ms': round(median, 3),
+        'ci95_ms': [round(low, 3), round(high, 3)],
+        'min_ms': round(min(samples_ms), 3),
+        'max_ms': round(max(samples_ms), 3),
+        'per_call_us': round(median * 1000 / calls, 3) if calls else None,
+    }
+
+
+# ---- Runner ----
+def run_once(scenario, keys, dataset, cached):
+    """Time one pass over ``keys``; the cache starts cold for each pass."""
+    cache = scenario.function.cache
+    cache.clear()
+    cache.reset_stats()
+    call = scenario.call
+    start = time.perf_counter_ns()
+    for key in keys:
+        call(key, dataset, cached)
+    return time.perf_counter_ns() - start
+
+
+def run_benchmark(scenario, keys, dataset, cached=True, warmup=1, repeat=5):
+    """Run ``warmup`` untimed passes then ``repeat`` timed passes; return a summary dict."""
+    for _ in range(warmup):
+        run_once(scenario, keys, dataset, cached)
+    samples = [run_once(scenario, keys, dataset, cached) for _ in range(repeat)]
+    result = summarize(samples, len(keys))
+    if cached:
+        stats = scenario.function.cache.stats()
+        result['hit_rate'] = stats['hit_rate']
+        result['evictions'] = stats['evictions']
+    return result
+
+
+def compare_policies(keys, maxsize, policies=POLICIES):
+    """
+    Replay ``keys`` through an InstrumentedCache per eviction policy.
+
+    Only hit rate depends on the policy, so the loads are no-ops rather than
+    queries. Returns ``{policy: hit_rate}``.
+    """
+    hit_rates = {}
+    for policy in policies:
+        cache = InstrumentedCache(maxsize=maxsize, ttl=3600, policy=policy)
+        for key in keys:
+            cache.get_or_load(key, lambda: None)
+        hit_rates[policy] = cache.stats()['hit_rate']
+    return hit_rates
+
+
+def print_policy_table(rows, policies=POLICIES):
+    """Print ``[(label, {policy: hit_rate}), ...]`` as a table."""
+    header = f"{'Workload':<42} | " + ' | '.join(f'{policy:>9}' for policy in policies)
+    print(header)
+    print('-' * len(header))
+    for label, hit_rates in rows:
+        print(f'{label:<42} | ' + ' | '.join(f'{hit_rates[policy]:>8}%' for policy in policies))
+
+
+def seed_dataset(users=200, products=50, orders_per_user=5, items_per_order=3, seed=0):
+    """Fill the current database with synthetic data; returns the dataset sizes."""
+    rng = random.Random(seed)
+    add_users_bulk((f'User {uid}', f'user{uid}@example.com') for uid in range(1, users + 1))
+    add_products_bulk((f'Product {pid}', pid * 10) for pid in range(1, products + 1))
+    order_ids = add_orders_bulk(uid for uid in range(1, users + 1) for _ in range(orders_per_user))
+    add_order_items_bulk(
+        (order_id, rng.randint(1, products), rng.randint(1, 5))
+        for order_id in order_ids
+        for _ in range(items_per_order)
+    )
+    return {
+        'users': users,
+        'products': products,
+        'orders': len(order_ids),
+        'order_items': len(order_ids) * items_per_order,
+    }
+
+
+def run_suite(scenarios, workloads, dataset, calls=1000, warmup=1, repeat=5, uncached=True, seed=0):
+    """Run every scenario x workload; returns a list of result dicts."""
+    results = []
+    for scenario in scenarios:
+        key_space = scenario.key_space(dataset)
+        for workload in workloads:
+            keys = WORKLOADS[workload](calls, key_space, random.Random(seed))
+            result = {
+                'scenario': scenario.name,
+                'workload': workload,
+                'calls': calls,
+                'unique_keys': len(set(keys)),
+                'cached': run_benchmark(scenario, keys, dataset, True, warmup, repeat),
+            }
+            if uncached:
+                result['uncached'] = run_benchmark(scenario, keys, dataset, False, warmup, repeat)
+                result['speedup'] = round(
+                    result['uncached']['median_ms'] / max(result['cached']['median_ms'], 1e-9), 2
+                )
+            results.append(result)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    previous = {(r['scenario'], r['workload']): r for r in (baseline or {}).get('results', [])}
+    header = (f"{'Scenario':<20} | {'Workload':<8} | {'Cached ms (95% CI)':<26} | "
+              f"{'Uncached ms':>11} | {'Speedup':>7} | {'Hit %':>6}")
+    if previous:
+        header += f" | {'vs base':>8}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        cached = r['cached']
+        ci = f"{cached['median_ms']:.2f} ({cached['ci95_ms'][0]:.2f}-{cached['ci95_ms'][1]:.2f})"
+        uncached = f"{r['uncached']['median_ms']:.2f}" if 'uncached' in r else '-'
+        speedup = f"{r['speedup']:.2f}x" if 'speedup' in r else '-'
+        line = (f"{r['scenario']:<20} | {r['workload']:<8} | {ci:<26} | {uncached:>11} | "
+                f"{speedup:>7} | {cached['hit_rate']:>6}")
+        if previous:
+            before = previous.get((r['scenario'], r['workload']))
+            if before:
+                change = (cached['median_ms'] / before['cached']['median_ms'] - 1) * 100
+                line += f' | {change:>+7.1f}%'
+            else:
+                line += f" | {'new':>8}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the cached CRUD functions.')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run (repeatable; default: all)')
+    parser.add_argument('--workload', action='append', choices=sorted(WORKLOADS),
+                        help='key distribution (repeatable; default: all)')
+    parser.add_argument('--calls', type=int, default=1000, help='calls per timed pass')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed passes before timing')
+    parser.add_argument('--repeat', type=int, default=5, help='timed passes')
+    parser.add_argument('--no-uncached', action='store_true', help='skip the uncached baseline')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--orders-per-user', type=int, default=5)
+    parser.add_argument('--items-per-order', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--policies', action='store_true',
+                        help='compare eviction-policy hit rates on the user key space and exit')
+    parser.add_argument('--maxsize', type=int, default=50, help='cache size for --policies')
+    parser.add_argument('--json', help='write results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    scenarios = [SCENARIOS[name] for name in (args.scenario or SCENARIOS)]
+    workloads = args.workload or list(WORKLOADS)
+
+    if args.policies:
+        print(f'=== Hit rate by eviction policy: {args.users} keys, maxsize={args.maxsize} ===')
+        rows = [
+            (workload, compare_policies(
+                WORKLOADS[workload](args.calls, args.users, random.Random(args.seed)), args.maxsize
+            ))
+            for workload in workloads
+        ]
+        print_policy_table(rows)
+        return rows
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.set_session(database_url=f'sqlite:///{os.path.join(tmp, "benchmark.db")}')
+        dataset = seed_dataset(args.users, args.products, args.orders_per_user,
+                               args.items_per_order, args.seed)
+        results = run_suite(scenarios, workloads, dataset, args.calls, args.warmup,
+                            args.repeat, not args.no_uncached, args.seed)
+        db.engine.dispose()
+        db.read_engine.dispose()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('json', 'compare')},
+        'dataset': dataset,
+        'results': results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.json}')
+    return report
+
+
+if __name__ == '__main__':
+    main()
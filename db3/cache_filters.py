@@ -0,0 +1,64 @@
+"""In-memory existence filters that answer "does this id exist?" without a query."""
+import threading
+
+
+class IdBitmap:
+    """
+    Set of live integer ids, one bit per id, filled lazily by ``load_ids()``.
+
+    ``in`` only answers False for ids that certainly do not exist; when the
+    filter is disabled, not yet loadable or given a non-integer id it answers
+    True, so callers fall through to the database. add()/discard() keep a
+    loaded bitmap current; reset() makes the next lookup reload it.
+    """
+    def __init__(self, load_ids, enabled=True):
+        self.load_ids = load_ids
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.rejected = 0
+        self._bits = None
+
+    def _ensure_loaded(self):
+        # Called with the lock held; commits applied meanwhile wait for it,
+        # so none can slip between the query and the bitmap taking over.
+        if self._bits is None:
+            bits = bytearray()
+            for id_ in self.load_ids():
+                _set_bit(bits, id_)
+            self._bits = bits
+        return self._bits
+
+    def __contains__(self, id_):
+        if not self.enabled or not isinstance(id_, int) or id_ < 0:
+            return True
+        with self.lock:
+            bits = self._ensure_loaded()
+            byte = id_ >> 3
+            if byte < len(bits) and bits[byte] >> (id_ & 7) & 1:
+                return True
+            self.rejected += 1
+            return False
+
+    def add(self, id_):
+        with self.lock:
+            if self._bits is not None and isinstance(id_, int) and id_ >= 0:
+                _set_bit(self._bits, id_)
+
+    def discard(self, id_):
+        with self.lock:
+            if self._bits is not None and isinstance(id_, int) and 0 <= id_ >> 3 < len(self._bits):
+                self._bits[id_ >> 3] &= ~(1 << (id_ & 7)) & 0xFF
+
+    def reset(self):
+        with self.lock:
+            self._bits = None
+
+    def memory_bytes(self):
+        return len(self._bits) if self._bits is not None else 0
+
+
+def _set_bit(bits, id_):
+    byte = id_ >> 3
+    if byte >= len(bits):
+        bits.extend(bytes(byte + 1 - len(bits)))
+    bits[byte] |= 1 << (id_ & 7)
@@ -0,0 +1,205 @@
+"""Latency histograms, size estimates and Prometheus exposition for the CRUD caches."""
+import bisect
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the load-latency buckets, Prometheus style.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in seconds; constant memory."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def percentile(self, q):
+        """
+        Estimate the ``q``-th percentile (0-100) in seconds.
+
+        Interpolates linearly inside the bucket holding the rank, like
+        Prometheus' histogram_quantile(). Returns None with no observations.
+        """
+        with self._lock:
+            if self.count == 0:
+                return None
+            rank = q / 100 * self.count
+            seen = 0
+            for i, n in enumerate(self.counts):
+                if n and seen + n >= rank:
+                    lower = self.buckets[i - 1] if i > 0 else 0.0
+                    if i == len(self.buckets):
+                        return lower  # +Inf bucket: the best we know is its lower bound
+                    return lower + (self.buckets[i] - lower) * (rank - seen) / n
+                seen += n
+            return self.buckets[-1]
+
+    def cumulative(self):
+        """Return ``[(upper_bound, cumulative_count), ...]`` ending with ``+Inf``."""
+        with self._lock:
+            total = 0
+            result = []
+            for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+                total += n
+                result.append((bound, total))
+            return result
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.sum = 0.0
+            self.count = 0
+
+
+def deep_sizeof(obj, _seen=None):
+    """Approximate bytes held by ``obj`` and the containers/strings it references."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, _seen) + deep_sizeof(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, _seen) for item in obj)
+    else:
+        for slot in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, slot):
+                size += deep_sizeof(getattr(obj, slot), _seen)
+    return size
+
+
+def approx_sizeof(obj, sample=8):
+    """
+    Fast estimate of deep_sizeof(obj) for cache payloads (lists of row dicts).
+
+    Lists and tuples longer than ``sample`` are sized from ``sample`` evenly
+    spaced elements, so the cost does not grow with the payload. String dict
+    keys are skipped since field names are shared by every row.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return size + sum(
+            (0 if isinstance(k, str) else approx_sizeof(k, sample)) + approx_sizeof(v, sample)
+            for k, v in obj.items()
+        )
+    if isinstance(obj, (list, tuple)):
+        if len(obj) > sample:
+            step = len(obj) / sample
+            picked = sum(approx_sizeof(obj[int(i * step)], sample) for i in range(sample))
+            return size + picked * len(obj) // sample
+        return size + sum(approx_sizeof(item, sample) for item in obj)
+    if isinstance(obj, (set, frozenset)):
+        return size + sum(approx_sizeof(item, sample) for item in obj)
+    for slot in getattr(type(obj), '__slots__', ()):
+        if hasattr(obj, slot):
+            size += approx_sizeof(getattr(obj, slot), sample)
+    return size
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def render_prometheus(caches=None):
+    """Render the metrics of ``caches`` (default: every registered cache) in Prometheus text format."""
+    if caches is None:
+        from cache_utils import registered_caches
+        caches = registered_caches()
+
+    families = {
+        'cache_hits_total': ('counter', 'Lookups served from the in-process cache.'),
+        'cache_misses_total': ('counter', 'Lookups not found in the in-process cache.'),
+        'cache_evictions_total': ('counter', 'Entries removed, by reason (expired, lru, invalidated).'),
+        'cache_entries': ('gauge', 'Entries currently held.'),
+        'cache_max_entries': ('gauge', 'Configured maximum size.'),
+        'cache_memory_bytes': ('gauge', 'Approximate memory held by cached values.'),
+        'cache_load_duration_seconds': ('histogram', 'Time to resolve a miss.'),
+    }
+    samples = {name: [] for name in families}
+    for cache in caches:
+        name = _label(cache.name)
+        stats = cache.stats()
+        samples['cache_hits_total'].append(f'cache_hits_total{{cache="{name}"}} {stats["hits"]}')
+        samples['cache_misses_total'].append(f'cache_misses_total{{cache="{name}"}} {stats["misses"]}')
+        for reason, count in stats['evictions'].items():
+            samples['cache_evictions_total'].append(
+                f'cache_evictions_total{{cache="{name}",reason="{reason}"}} {count}'
+            )
+        samples['cache_entries'].append(f'cache_entries{{cache="{name}"}} {stats["size"]}')
+        samples['cache_max_entries'].append(f'cache_max_entries{{cache="{name}"}} {stats["maxsize"]}')
+        samples['cache_memory_bytes'].append(f'cache_memory_bytes{{cache="{name}"}} {stats["bytes"]}')
+        histogram = cache.load_latency
+        for bound, count in histogram.cumulative():
+            samples['cache_load_duration_seconds'].append(
+                f'cache_load_duration_seconds_bucket{{cache="{name}",le="{_format_bound(bound)}"}} {count}'
+            )
+        samples['cache_load_duration_seconds'].append(
+            f'cache_load_duration_seconds_sum{{cache="{name}"}} {histogram.sum}'
+        )
+        samples['cache_load_duration_seconds'].append(
+            f'cache_load_duration_seconds_count{{cache="{name}"}} {histogram.count}'
+        )
+
+    lines = []
+    for metric, (kind, help_text) in families.items():
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        lines.extend(samples[metric])
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/ready':
+            ready = self.server.ready
+            if ready is None or ready.is_set():
+                self._reply(200, b'ready\n')
+            else:
+                self._reply(503, b'warming up\n')
+            return
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        self._reply(200, render_prometheus().encode(), 'text/plain; version=0.0.4; charset=utf-8')
+
+    def _reply(self, status, body, content_type='text/plain; charset=utf-8'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep scrapes out of stderr
+
+
+def start_metrics_server(port=9100, host='127.0.0.1', ready=None):
+    """
+    Serve ``/metrics`` for every registered cache from a daemon thread; returns the server.
+
+    ``/ready`` answers 503 until the ``ready`` event (e.g. cache_warmup.ready)
+    is set, and 200 after it, or always if no event is given.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.ready = ready
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,239 @@
+"""Eviction/admission policies that InstrumentedCache can use instead of plain LRU.
+
+A policy only tracks keys; the cache owns the values. The cache calls
+``on_insert(key)`` for a new entry, ``on_hit(key)`` on every hit,
+``on_remove(key)`` when an entry is deleted, expired or invalidated, and
+``evict(incoming)`` when it is full and needs a victim for ``incoming``.
+``evict`` must return a resident key and stop tracking it.
+"""
+from collections import OrderedDict, defaultdict
+
+
+class LFUPolicy:
+    """Evict the least frequently used key; ties go to the least recently used."""
+
+    def __init__(self, maxsize):
+        self.freq = {}
+        self.buckets = defaultdict(OrderedDict)  # frequency -> keys, oldest first
+
+    def _move(self, key, freq):
+        old = self.freq.get(key)
+        if old is not None:
+            bucket = self.buckets[old]
+            del bucket[key]
+            if not bucket:
+                del self.buckets[old]
+        self.freq[key] = freq
+        self.buckets[freq][key] = None
+
+    def on_insert(self, key):
+        self._move(key, 1)
+
+    def on_hit(self, key):
+        if key in self.freq:
+            self._move(key, self.freq[key] + 1)
+
+    def on_remove(self, key):
+        freq = self.freq.pop(key, None)
+        if freq is not None:
+            bucket = self.buckets[freq]
+            del bucket[key]
+            if not bucket:
+                del self.buckets[freq]
+
+    def evict(self, incoming=None):
+        lowest = min(self.buckets)
+        key = next(iter(self.buckets[lowest]))
+        self.on_remove(key)
+        return key
+
+    def clear(self):
+        self.freq.clear()
+        self.buckets.clear()
+
+
+class ARCPolicy:
+    """
+    Adaptive Replacement Cache (Megiddo & Modha).
+
+    Keys seen once live in T1 and keys seen again in T2; the ghost lists B1/B2
+    remember recently evicted keys so the split ``p`` between T1 and T2 adapts
+    to the workload. A one-pass scan only churns T1 and leaves T2 alone.
+    """
+
+    def __init__(self, maxsize):
+        self.c = maxsize
+        self.p = 0
+        self.t1, self.t2 = OrderedDict(), OrderedDict()
+        self.b1, self.b2 = OrderedDict(), OrderedDict()
+        self._adapted = None
+
+    def _adapt(self, key):
+        if key in self.b1:
+            self.p = min(self.c, self.p + max(len(self.b2) // len(self.b1), 1))
+        elif key in self.b2:
+            self.p = max(0, self.p - max(len(self.b1) // len(self.b2), 1))
+        self._adapted = key
+
+    def on_insert(self, key):
+        if self._adapted != key:
+            self._adapt(key)
+        self._adapted = None
+        if key in self.b1 or key in self.b2:
+            # Seen before it was evicted: it is a frequent key now.
+            self.b1.pop(key, None)
+            self.b2.pop(key, None)
+            self.t2[key] = None
+        else:
+            self.t1[key] = None
+        while len(self.t1) + len(self.b1) > self.c and self.b1:
+            self.b1.popitem(last=False)
+        while len(self.t1) + len(self.t2) + len(self.b1) + len(self.b2) > 2 * self.c and self.b2:
+            self.b2.popitem(last=False)
+
+    def on_hit(self, key):
+        if key in self.t1:
+            del self.t1[key]
+            self.t2[key] = None
+        elif key in self.t2:
+            self.t2.move_to_end(key)
+
+    def on_remove(self, key):
+        self.t1.pop(key, None)
+        self.t2.pop(key, None)
+
+    def evict(self, incoming=None):
+        self._adapt(incoming)
+        if self.t1 and (
+            len(self.t1) > self.p or (incoming in self.b2 and len(self.t1) == self.p) or not self.t2
+        ):
+            key, _ = self.t1.popitem(last=False)
+            self.b1[key] = None
+        else:
+            key, _ = self.t2.popitem(last=False)
+            self.b2[key] = None
+        return key
+
+    def clear(self):
+        self.p = 0
+        for keys in (self.t1, self.t2, self.b1, self.b2):
+            keys.clear()
+
+
+class CountMinSketch:
+    """Approximate access counts (4-bit saturating) that halve periodically to age out old keys."""
+
+    def __init__(self, maxsize, depth=4):
+        width = 16
+        while width < 4 * maxsize:
+            width *= 2
+        self.mask = width - 1
+        self.rows = [bytearray(width) for _ in range(depth)]
+        self.additions = 0
+        self.sample_size = 10 * max(maxsize, 1)
+
+    def _indexes(self, key):
+        return [hash((seed, key)) & self.mask for seed in range(len(self.rows))]
+
+    def add(self, key):
+        for row, index in zip(self.rows, self._indexes(key)):
+            if row[index] < 15:
+                row[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            for row in self.rows:
+                for i, count in enumerate(row):
+                    row[i] = count >> 1
+            self.additions //= 2
+
+    def estimate(self, key):
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+    def clear(self):
+        for row in self.rows:
+            row[:] = bytes(len(row))
+        self.additions = 0
+
+
+class WTinyLFUPolicy:
+    """
+    W-TinyLFU (as in Caffeine): a small LRU window in front of a segmented LRU.
+
+    New keys enter the 1% window. When the window overflows, its oldest key
+    only displaces the main cache's victim if the frequency sketch has seen it
+    more often, so one-off keys from scans rarely push out popular ones.
+    """
+
+    def __init__(self, maxsize, window_fraction=0.01, protected_fraction=0.8):
+        self.window_size = max(1, int(maxsize * window_fraction))
+        main = max(1, maxsize - self.window_size)
+        self.protected_size = max(1, int(main * protected_fraction))
+        self.window, self.probation, self.protected = OrderedDict(), OrderedDict(), OrderedDict()
+        self.sketch = CountMinSketch(maxsize)
+
+    def on_insert(self, key):
+        self.sketch.add(key)
+        self.window[key] = None
+        # While the cache is filling up, window overflow moves to the main area.
+        while len(self.window) > self.window_size:
+            oldest, _ = self.window.popitem(last=False)
+            self.probation[oldest] = None
+
+    def on_hit(self, key):
+        self.sketch.add(key)
+        if key in self.window:
+            self.window.move_to_end(key)
+        elif key in self.probation:
+            del self.probation[key]
+            self.protected[key] = None
+            if len(self.protected) > self.protected_size:
+                demoted, _ = self.protected.popitem(last=False)
+                self.probation[demoted] = None
+        elif key in self.protected:
+            self.protected.move_to_end(key)
+
+    def on_remove(self, key):
+        for segment in (self.window, self.probation, self.protected):
+            segment.pop(key, None)
+
+    def _main_victim(self):
+        for segment in (self.probation, self.protected):
+            if segment:
+                return segment, next(iter(segment))
+        return None, None
+
+    def evict(self, incoming=None):
+        segment, victim = self._main_victim()
+        if self.window and (len(self.window) >= self.window_size or victim is None):
+            candidate = next(iter(self.window))
+            del self.window[candidate]
+            if victim is None or self.sketch.estimate(candidate) <= self.sketch.estimate(victim):
+                return candidate
+            self.probation[candidate] = None
+        del segment[victim]
+        return victim
+
+    def clear(self):
+        for segment in (self.window, self.probation, self.protected):
+            segment.clear()
+        self.sketch.clear()
+
+
+# 'lru' keeps TTLCache's own LRU ordering.
+POLICIES = {
+    'lru': None,
+    'lfu': LFUPolicy,
+    'arc': ARCPolicy,
+    'w-tinylfu': WTinyLFUPolicy,
+}
+
+
+def make_policy(policy, maxsize):
+    """Build a policy from its name in POLICIES; other values are used as-is."""
+    if isinstance(policy, str):
+        try:
+            factory = POLICIES[policy]
+        except KeyError:
+            raise ValueError(f'Unknown cache policy {policy!r}; expected one of {sorted(POLICIES)}.')
+        return factory(maxsize) if factory else None
+    return policy
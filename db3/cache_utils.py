@@ -1,29 +1,700 @@
-from cachetools import TTLCache
+import asyncio
+import functools
+import threading
+import time
+import weakref
+from collections import defaultdict
+from contextvars import ContextVar
+
+from cachetools import Cache, TTLCache, keys
+
+from cache_metrics import LatencyHistogram, approx_sizeof, deep_sizeof
+from cache_policies import make_policy
+
+# Every InstrumentedCache registers itself here so invalidate() and the
+# metrics exposition can reach it.
+_caches = weakref.WeakValueDictionary()
+
+# Cache loads currently running (see cached()).
+_loading = ContextVar('_loading', default=None)
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+class _Load:
+    """
+    Tags read by one running cache load, and tags invalidated meanwhile.
+
+    invalidate() records tags only in loads registered with ``with _Load()``;
+    callers keep the load registered until its value is stored, so a commit
+    landing after the loader returned still keeps the value out.
+    """
+    __slots__ = ('tags', 'invalidated')
+
+    def __init__(self):
+        self.tags = set()
+        self.invalidated = set()
+
+    def __enter__(self):
+        with _in_flight_lock:
+            _in_flight.add(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        with _in_flight_lock:
+            _in_flight.discard(self)
+
+
+class _Flight:
+    """A load in progress that other threads asking for the same key wait on."""
+    __slots__ = ('done', 'value', 'error', 'tags')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.tags = frozenset()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        depends_on(*self.tags)
+        return self.value
+
+
+def _tracked(loader, load):
+    """Run ``loader`` and return its value, collecting the tags it declares in ``load``."""
+    token = _loading.set(load)
+    try:
+        return loader()
+    finally:
+        _loading.reset(token)
+
+
+def _hit_rate(hits, misses):
+    total = hits + misses
+    return round((hits / total) * 100, 2) if total > 0 else 0
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def registered_caches():
+    """Return every live InstrumentedCache, e.g. for metrics exposition."""
+    return list(_caches.values())
+
+
+async def _tracked_async(loader, load):
+    """Async twin of _tracked(): awaits ``loader()``."""
+    token = _loading.set(load)
+    try:
+        return await loader()
+    finally:
+        _loading.reset(token)
+
+
+class _LeaderCancelled(Exception):
+    """Set on an async flight whose loading task was cancelled, so its waiters retry."""
+
+
+def _consume_result(future):
+    # Avoid "exception was never retrieved" when no other task awaited the flight.
+    if not future.cancelled():
+        future.exception()
+
 
 class InstrumentedCache(TTLCache):
-    def __init__(self, *args, **kwargs):
+    """
+    TTLCache that counts hits/misses and tracks the dependency tags of its entries.
+
+    ``l2`` is an optional second-tier store (see cache_backends) that misses
+    read through to and new entries are written through to, so entries
+    survive restarts and are shared between worker processes. ``l2_ttl``
+    defaults to ``ttl``. ``name`` labels the cache in stats and metrics.
+    ``policy`` picks the eviction policy by name from cache_policies.POLICIES
+    ('lru', 'lfu', 'arc', 'w-tinylfu') or takes a policy object; TTL expiry
+    applies whatever the policy. Each value is measured with ``sizeof``
+    (approx_sizeof by default) and the total is reported as ``bytes`` in
+    stats(). ``max_bytes`` adds a memory ceiling on top of the ``maxsize``
+    entry limit: entries are evicted by the policy until a new one fits, and
+    a value larger than the whole budget is not cached.
+    """
+    def __init__(self, *args, name=None, l2=None, l2_ttl=None, policy='lru',
+                 max_bytes=None, sizeof=approx_sizeof, **kwargs):
         super().__init__(*args, **kwargs)
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.currbytes = 0
+        self._sizes = {}
+        self.name = name or f'cache_{id(self):x}'
+        self.policy = make_policy(policy, self.maxsize)
+        self.policy_name = policy if isinstance(policy, str) else type(policy).__name__
+        self._incoming = None
         self.hits = 0
         self.misses = 0
+        self.expirations = 0
+        self.lru_evictions = 0
+        self.invalidations = 0
+        self.load_latency = LatencyHistogram()
+        self.l2 = l2
+        self.l2_ttl = l2_ttl if l2_ttl is not None else self.ttl
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self._async_flights = {}
+        self._requests = {}  # resident key -> requests since it was stored
+        self._key_tags = {}
+        self._tag_keys = defaultdict(set)
+        _caches[id(self)] = self
 
     def __getitem__(self, key):
         try:
             result = super().__getitem__(key)
             self.hits += 1
+            self._requests[key] = self._requests.get(key, 0) + 1
+            if self.policy is not None:
+                self.policy.on_hit(key)
             return result
         except KeyError:
             self.misses += 1
             raise
 
+    def __setitem__(self, key, value):
+        size = self.sizeof(value)
+        # Expire first: a reload of an expired key is a new entry to the policy.
+        self.expire()
+        if self.max_bytes is not None:
+            self._make_room(key, size)
+        if self.policy is None or Cache.__contains__(self, key):
+            super().__setitem__(key, value)
+        else:
+            # Let popitem() tell the policy which key needs the room.
+            self._incoming = key
+            try:
+                super().__setitem__(key, value)
+            finally:
+                self._incoming = None
+            self.policy.on_insert(key)
+        self._requests.setdefault(key, 1)  # the miss that loaded it
+        self.currbytes += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+
+    def _make_room(self, key, size):
+        """Evict until ``size`` more bytes fit in max_bytes under ``key``."""
+        if size > self.max_bytes:
+            raise ValueError('value too large')
+        self._incoming = key
+        try:
+            while self.currbytes - self._sizes.get(key, 0) + size > self.max_bytes:
+                self.popitem()
+        finally:
+            self._incoming = None
+
+    def __delitem__(self, key):
+        try:
+            super().__delitem__(key)
+        finally:
+            self._removed(key)
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        self.expirations += len(expired)
+        for key, _ in expired:
+            self._removed(key)
+        return expired
+
+    def popitem(self):
+        """Evict one entry to make room: the policy's victim, or the LRU entry."""
+        if self.policy is not None:
+            key = self.policy.evict(self._incoming)
+            value = Cache.__getitem__(self, key)
+            try:
+                del self[key]
+            except KeyError:
+                pass  # expired meanwhile; it is gone either way
+            self.lru_evictions += 1
+            return key, value
+        hits = self.hits
+        item = super().popitem()
+        self.hits = hits  # Cache.pop() reads the victim through __getitem__
+        self.lru_evictions += 1
+        return item
+
+    def clear(self):
+        super().clear()
+        self.currbytes = 0
+        self._sizes.clear()
+        self._requests.clear()
+        self._key_tags.clear()
+        self._tag_keys.clear()
+        if self.policy is not None:
+            self.policy.clear()
+
+    def hot_keys(self, limit=None):
+        """Return resident keys, most requested first (e.g. to snapshot for warm-up)."""
+        ranked = sorted(self._requests.items(), key=lambda item: item[1], reverse=True)
+        return [key for key, _ in ranked[:limit]]
+
+    def set_dependencies(self, key, tags):
+        """Record the tags (tables/rows) the entry stored under ``key`` was built from."""
+        self._forget(key)
+        tags = frozenset(tags)
+        self._key_tags[key] = tags
+        for tag in tags:
+            self._tag_keys[tag].add(key)
+
+    def dependencies(self, key):
+        """Return the tags recorded for ``key`` (empty if none were recorded)."""
+        return self._key_tags.get(key, frozenset())
+
+    def invalidate(self, tags):
+        """Drop every entry that depends on any of ``tags``; return how many L1 entries were dropped."""
+        dropped = self._invalidate_local(tags)
+        if self.l2 is not None:
+            self.l2.invalidate(tags)
+        return dropped
+
+    def _invalidate_local(self, tags):
+        stale = set()
+        for tag in tags:
+            stale.update(self._tag_keys.get(tag, ()))
+        for key in stale:
+            try:
+                del self[key]
+            except KeyError:
+                pass  # already expired
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def get_or_load(self, key, loader):
+        """Return the entry for ``key``, calling ``loader()`` to fill it on a miss."""
+        try:
+            value = self[key]
+        except KeyError:
+            pass
+        else:
+            depends_on(*self.dependencies(key))
+            return value
+        with _Load() as load:
+            value, from_l2 = self._load(key, loader, load)
+            stored = self._store(key, value, load)
+        if stored and not from_l2:
+            self._write_through(key, value, load)
+        return value
+
+    def load_many(self, keys, loader):
+        """
+        Return ``{key: value}`` for ``keys``, loading every miss with one call.
+
+        ``loader(missing_keys)`` returns ``{key: (value, tags)}`` for the keys
+        it found, e.g. from a single ``IN`` query; each value is stored with
+        its own tags. Batches skip L2 reads (one round trip per key would
+        defeat the batching) but write through to it. Keys the loader leaves
+        out are neither cached nor returned.
+        """
+        keys = list(dict.fromkeys(keys))
+        found, missing = {}, []
+        for key in keys:
+            try:
+                found[key] = self[key]
+            except KeyError:
+                missing.append(key)
+            else:
+                depends_on(*self.dependencies(key))
+        if missing:
+            with _Load() as batch:
+                start = time.perf_counter()
+                try:
+                    loaded = _tracked(lambda: loader(missing), batch)
+                finally:
+                    self.load_latency.observe(time.perf_counter() - start)
+                for key, (value, tags) in loaded.items():
+                    load = _Load()
+                    load.tags.update(tags)
+                    load.invalidated = batch.invalidated
+                    if self._store(key, value, load):
+                        self._write_through(key, value, load)
+                    found[key] = value
+        return {key: found[key] for key in keys if key in found}
+
+    async def get_or_load_async(self, key, loader):
+        """
+        Async twin of get_or_load(); ``loader()`` returns an awaitable.
+
+        Tasks on the same event loop that miss the same key at once share a
+        single load. If the task running it is cancelled, the waiting tasks
+        start the load again rather than being cancelled with it.
+        """
+        while True:
+            try:
+                value = self[key]
+            except KeyError:
+                pass
+            else:
+                depends_on(*self.dependencies(key))
+                return value
+
+            flight_key = (asyncio.get_running_loop(), key)
+            flight = self._async_flights.get(flight_key)
+            if flight is None:
+                return await self._lead_async_flight(flight_key, key, loader)
+            try:
+                value, tags = await asyncio.shield(flight)
+            except _LeaderCancelled:
+                continue
+            depends_on(*tags)
+            return value
+
+    async def _lead_async_flight(self, flight_key, key, loader):
+        flight = self._async_flights[flight_key] = asyncio.get_running_loop().create_future()
+        flight.add_done_callback(_consume_result)
+        try:
+            with _Load() as load:
+                value, from_l2 = await self._load_async(key, loader, load)
+                stored = self._store(key, value, load)
+            if stored and not from_l2:
+                await asyncio.to_thread(self._write_through, key, value, load)
+        except asyncio.CancelledError:
+            flight.set_exception(_LeaderCancelled())
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result((value, frozenset(load.tags)))
+            return value
+        finally:
+            del self._async_flights[flight_key]
+
+    async def _load_async(self, key, loader, load):
+        start = time.perf_counter()
+        try:
+            if self.l2 is not None:
+                found = await asyncio.to_thread(self.l2.get, key)
+                self._record_l2(found is not None)
+                if found is not None:
+                    value, tags = found
+                    load.tags.update(tags)
+                    return value, True
+            return await _tracked_async(loader, load), False
+        finally:
+            self.load_latency.observe(time.perf_counter() - start)
+
+    def _load(self, key, loader, load):
+        """Read ``key`` from L2, or run ``loader``, collecting tags in ``load``; returns ``(value, from_l2)``."""
+        start = time.perf_counter()
+        try:
+            return self._load_untimed(key, loader, load)
+        finally:
+            self.load_latency.observe(time.perf_counter() - start)
+
+    def _load_untimed(self, key, loader, load):
+        if self.l2 is not None:
+            found = self.l2.get(key)
+            self._record_l2(found is not None)
+            if found is not None:
+                value, tags = found
+                load.tags.update(tags)
+                return value, True
+        return _tracked(loader, load), False
+
+    def _record_l2(self, hit):
+        if hit:
+            self.l2_hits += 1
+        else:
+            self.l2_misses += 1
+
+    def _store(self, key, value, load):
+        """Put a loaded value in L1; return False if it was not stored."""
+        depends_on(*load.tags)
+        # Skip storing if a tag the value was built from was invalidated
+        # while it loaded, since it may already be stale.
+        if load.tags & load.invalidated:
+            return False
+        try:
+            self[key] = value
+        except ValueError:
+            return False  # value too large
+        self.set_dependencies(key, load.tags)
+        return True
+
+    def _write_through(self, key, value, load):
+        if self.l2 is not None:
+            self.l2.set(key, value, load.tags, self.l2_ttl)
+
+    def _removed(self, key):
+        self.currbytes -= self._sizes.pop(key, 0)
+        self._requests.pop(key, None)
+        self._forget(key)
+        if self.policy is not None:
+            self.policy.on_remove(key)
+
+    def _forget(self, key):
+        for tag in self._key_tags.pop(key, ()):
+            bucket = self._tag_keys.get(tag)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._tag_keys[tag]
+
+    def _values(self):
+        # Read through Cache.__getitem__ so sizing does not count as hits.
+        return [Cache.__getitem__(self, key) for key in list(TTLCache.__iter__(self))]
+
+    def memory_bytes(self):
+        """
+        Exact bytes held by the cached values, walking every entry.
+
+        This is slow for large caches, so stats() reports the running
+        ``bytes`` total instead; call this explicitly when the exact figure
+        is wanted.
+        """
+        # Count objects shared between entries (e.g. interned names) once.
+        seen = set()
+        return sum(deep_sizeof(value, seen) for value in self._values())
+
     def stats(self):
-        total = self.hits + self.misses
-        hit_rate = (self.hits / total) * 100 if total > 0 else 0
-        return {
+        stats = {
             'hits': self.hits,
             'misses': self.misses,
-            'hit_rate': round(hit_rate, 2),
+            'hit_rate': _hit_rate(self.hits, self.misses),
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'policy': self.policy_name,
+            'bytes': self.currbytes,
+            'max_bytes': self.max_bytes,
+            'evictions': {
+                'expired': self.expirations,
+                'lru': self.lru_evictions,
+                'invalidated': self.invalidations,
+            },
+            'load_latency_ms': {
+                f'p{q}': _ms(self.load_latency.percentile(q)) for q in (50, 95, 99)
+            },
         }
+        stats['load_latency_ms']['count'] = self.load_latency.count
+        if self.l2 is not None:
+            stats['l2'] = {
+                'hits': self.l2_hits,
+                'misses': self.l2_misses,
+                'hit_rate': _hit_rate(self.l2_hits, self.l2_misses),
+            }
+        return stats
 
     def reset_stats(self):
         self.hits = 0
         self.misses = 0
+        self.expirations = 0
+        self.lru_evictions = 0
+        self.invalidations = 0
+        self.load_latency.reset()
+        self.l2_hits = 0
+        self.l2_misses = 0
+
+
+def depends_on(*tags):
+    """
+    Declare that the cache entry currently being loaded was built from ``tags``.
+
+    Tags are hashable values such as ``('products', 3)`` or
+    ``('orders.user_id', 7)``. Outside of a cached() load this is a no-op.
+    """
+    loading = _loading.get()
+    if loading is not None:
+        loading.tags.update(tags)
+
+
+def invalidate(*tags):
+    """Drop the entries of every InstrumentedCache that depend on any of ``tags``."""
+    if not tags:
+        return 0
+    with _in_flight_lock:
+        for load in _in_flight:
+            load.invalidated.update(tags)
+    return sum(cache.invalidate(tags) for cache in registered_caches())
+
+
+class ConcurrentInstrumentedCache(InstrumentedCache):
+    """
+    InstrumentedCache that can be shared between threads.
+
+    Every operation and counter update happens under one lock, and loads are
+    single-flight: when several threads miss the same key at once, one of
+    them runs the query and the others wait for its result. With
+    ``serve_stale=True`` entries that expired by TTL are kept aside and
+    returned to those other threads while the first one refreshes the key.
+    Invalidated entries are never served stale.
+    """
+    def __init__(self, *args, serve_stale=False, **kwargs):
+        self.lock = threading.RLock()
+        super().__init__(*args, **kwargs)
+        self.serve_stale = serve_stale
+        self.coalesced = 0
+        self.stale_served = 0
+        self._flights = {}
+        self._stale = {}
+
+    def __getitem__(self, key):
+        with self.lock:
+            return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        with self.lock:
+            super().__delitem__(key)
+
+    def __contains__(self, key):
+        with self.lock:
+            return super().__contains__(key)
+
+    def popitem(self):
+        with self.lock:
+            return super().popitem()
+
+    def _values(self):
+        # Only the snapshot is taken under the lock; memory_bytes() walks it
+        # without blocking readers.
+        with self.lock:
+            return super()._values()
+
+    def expire(self, time=None):
+        with self.lock:
+            # Bypass InstrumentedCache.expire so the tags can still be read
+            # before they are forgotten.
+            expired = TTLCache.expire(self, time)
+            self.expirations += len(expired)
+            for key, value in expired:
+                if self.serve_stale:
+                    self._stale[key] = (value, self._key_tags.get(key, frozenset()))
+                self._removed(key)
+            while len(self._stale) > self.maxsize:
+                del self._stale[next(iter(self._stale))]
+            return expired
+
+    def clear(self):
+        with self.lock:
+            super().clear()
+            self._stale.clear()
+
+    def set_dependencies(self, key, tags):
+        with self.lock:
+            super().set_dependencies(key, tags)
+
+    def dependencies(self, key):
+        with self.lock:
+            return super().dependencies(key)
+
+    def _store(self, key, value, load):
+        with self.lock:
+            return super()._store(key, value, load)
+
+    def hot_keys(self, limit=None):
+        with self.lock:
+            return super().hot_keys(limit)
+
+    def _invalidate_local(self, tags):
+        with self.lock:
+            tags = set(tags)
+            for key in [key for key, (_, deps) in self._stale.items() if deps & tags]:
+                del self._stale[key]
+            return super()._invalidate_local(tags)
+
+    def _record_l2(self, hit):
+        with self.lock:
+            super()._record_l2(hit)
+
+    def get_or_load(self, key, loader):
+        with self.lock:
+            try:
+                value = self[key]
+            except KeyError:
+                pass
+            else:
+                depends_on(*self.dependencies(key))
+                return value
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+            else:
+                leader = False
+                self.expire()
+                if key in self._stale:
+                    self.stale_served += 1
+                    value, tags = self._stale[key]
+                    depends_on(*tags)
+                    return value
+                self.coalesced += 1
+        if not leader:
+            return flight.wait()
+
+        try:
+            with _Load() as load:
+                try:
+                    value, from_l2 = self._load(key, loader, load)
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                flight.value = value
+                flight.tags = frozenset(load.tags)
+                with self.lock:
+                    self._stale.pop(key, None)
+                    stored = self._store(key, value, load)
+            if stored and not from_l2:
+                self._write_through(key, value, load)
+            return value
+        finally:
+            with self.lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self.lock:
+            stats = super().stats()
+            stats['coalesced'] = self.coalesced
+            stats['stale_served'] = self.stale_served
+            return stats
+
+    def reset_stats(self):
+        with self.lock:
+            super().reset_stats()
+            self.coalesced = 0
+            self.stale_served = 0
+
+
+def cached(cache, key=keys.hashkey):
+    """
+    Drop-in replacement for ``cachetools.cached`` that tracks dependencies.
+
+    Tags declared with depends_on() while the wrapped function runs are
+    attached to the stored entry, so invalidate() can later drop just the
+    entries built from the rows a write touched. Loading is delegated to
+    ``cache.get_or_load()``, so a ConcurrentInstrumentedCache also makes the
+    wrapped function single-flight per key.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return cache.get_or_load(key(*args, **kwargs), functools.partial(func, *args, **kwargs))
+
+        wrapper.cache = cache
+        wrapper.cache_key = key
+        return wrapper
+    return decorator
+
+
+def cached_async(cache, key=keys.hashkey):
+    """Async twin of cached() for coroutine functions."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await cache.get_or_load_async(key(*args, **kwargs), functools.partial(func, *args, **kwargs))
+
+        wrapper.cache = cache
+        wrapper.cache_key = key
+        return wrapper
+    return decorator
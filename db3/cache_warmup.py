@@ -0,0 +1,105 @@
+"""Warm the caches at startup from a snapshot of the last run's hottest keys.
+
+At shutdown, save_snapshot() writes every registered cache's resident keys,
+most requested first, to a JSON file. At the next start, warm_up() hands
+each cache's keys to the warmer registered for it, which reloads them in
+batches (e.g. every user's orders with one ``IN`` query), and then sets
+``ready`` so a health check can hold traffic until the caches are warm:
+
+    warm_up('cache_snapshot.json')                # before serving
+    start_metrics_server(ready=cache_warmup.ready)  # /ready turns 200
+    save_snapshot_at_exit('cache_snapshot.json')
+"""
+import ast
+import atexit
+import json
+import os
+import threading
+import time
+
+from cache_backends import encode_key
+from cache_utils import registered_caches
+
+SNAPSHOT_VERSION = 1
+
+# Set once warm_up() has finished (or found nothing to warm).
+ready = threading.Event()
+
+# cache name -> callable(keys) that loads those keys; returns how many it loaded
+_warmers = {}
+
+
+def register_warmer(cache, warmer):
+    """Use ``warmer(keys)`` to reload ``cache``'s snapshotted keys at warm-up."""
+    _warmers[cache.name] = warmer
+
+
+def _snapshot_key(key):
+    """Text form of ``key``, or None if it would not read back as an equal key."""
+    text = encode_key(key)
+    try:
+        return text if ast.literal_eval(text) == key else None
+    except (ValueError, SyntaxError):
+        return None
+
+
+def save_snapshot(path, caches=None, limit=None):
+    """Write the ``limit`` most requested keys of each cache to ``path``; returns the key counts."""
+    caches = registered_caches() if caches is None else caches
+    snapshot = {'version': SNAPSHOT_VERSION, 'saved_at': time.time(), 'caches': {}}
+    for cache in caches:
+        keys = [text for text in map(_snapshot_key, cache.hot_keys(limit)) if text is not None]
+        snapshot['caches'][cache.name] = keys
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)  # never leave a half-written snapshot behind
+    return {name: len(keys) for name, keys in snapshot['caches'].items()}
+
+
+def save_snapshot_at_exit(path, limit=None):
+    """Register save_snapshot(path) to run when the interpreter exits."""
+    atexit.register(save_snapshot, path, limit=limit)
+
+
+def load_snapshot(path):
+    """Return ``{cache name: [key, ...]}`` from ``path``, or ``{}`` if there is none."""
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return {}
+    return {
+        name: [ast.literal_eval(text) for text in keys]
+        for name, keys in snapshot['caches'].items()
+    }
+
+
+def warm_up(path, limit=None):
+    """
+    Reload the snapshotted keys of every cache that has a warmer, then set ``ready``.
+
+    Returns ``{cache name: {'keys': n, 'loaded': n, 'seconds': s}}``. Keys of
+    caches without a registered warmer are ignored. A warmer that raises does
+    not stop the others: its entry gets ``'error'`` instead of ``'loaded'``,
+    and ``ready`` is set regardless, since a cold cache still serves.
+    """
+    report = {}
+    try:
+        snapshot = load_snapshot(path)
+        for name, keys in snapshot.items():
+            warmer = _warmers.get(name)
+            if warmer is None or not keys:
+                continue
+            keys = keys[:limit]
+            start = time.perf_counter()
+            try:
+                outcome = {'loaded': warmer(keys)}
+            except Exception as e:
+                outcome = {'error': f'{type(e).__name__}: {e}'}
+            report[name] = {'keys': len(keys), **outcome, 'seconds': round(time.perf_counter() - start, 3)}
+    finally:
+        ready.set()
+    return report
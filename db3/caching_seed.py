@@ -1,4 +1,4 @@
-from crud import add_user, add_order, add_order_item, add_product
+from crud import add_users_bulk, add_products_bulk, add_orders_bulk, add_order_items_bulk
 import random
 
 from db_config import db
@@ -6,12 +6,12 @@ from db_config import db
 db.set_session(database_url='sqlite:///caching_test.db')
 
 # Create products
-for i in range(1, 11):
-    add_product(f'Product {i}', price=i * 10)
+add_products_bulk((f'Product {i}', i * 10) for i in range(1, 11))
 
 # Create users and orders
-for uid in range(1, 6):
-    add_user(f'User {uid}', f'user{uid}@email.com')
-    oid = add_order(uid)
-    for pid in range(1, 6):
-        add_order_item(order_id=oid, product_id=pid, quantity=random.randint(1, 5))
+user_ids = range(1, 6)
+add_users_bulk((f'User {uid}', f'user{uid}@email.com') for uid in user_ids)
+order_ids = add_orders_bulk(user_ids)
+add_order_items_bulk(
+    (oid, pid, random.randint(1, 5)) for oid in order_ids for pid in range(1, 6)
+)
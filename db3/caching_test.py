@@ -1,60 +1,38 @@
-import time
 import random
 
-from crud import get_user_orders_grouped as uncached_get_user_orders_grouped
-from crud_cache import get_user_orders_grouped as cached_get_user_orders_grouped
+from cache_benchmark import SCENARIOS, run_benchmark, compare_policies, print_policy_table
 from db_config import db
 
-from crud_cache import user_orders_cache
+# For every scenario x workload, run `python cache_benchmark.py` instead.
+scenario = SCENARIOS['user_orders']
 
-db.set_session(database_url='sqlite:///caching_test.db')
 
-
-def measure(fn, label, user_ids):
-    """Measure execution time of function fn over list of user_ids."""
-    start = time.time()
-    for user_id in user_ids:
-        fn(user_id)
-    end = time.time()
-    duration = end - start
-    print(f'{label} Duration: {duration:.4f} seconds')
-    return duration
-
-
-def run_scenario(description, user_ids):
+def run_scenario(description, user_ids, repeat=3):
     print(f'\n--- Scenario: {description} ---')
     print(f'Total calls: {len(user_ids)} | Unique user_ids: {len(set(user_ids))}')
 
     random.shuffle(user_ids)
-    uncached_ids = user_ids[:]
-    cached_ids = user_ids[:]
-
-    uncached_time = measure(uncached_get_user_orders_grouped, '[Uncached]', uncached_ids)
-
-    user_orders_cache.clear()
-    user_orders_cache.reset_stats()  # Reset counters
-
-    cached_time = measure(cached_get_user_orders_grouped, '[Cached]', cached_ids)
-
-    stats = user_orders_cache.stats()
-
-    if cached_time > 0:
-        speedup = uncached_time / cached_time
-        print(f'Speedup Factor: {speedup:.2f}x')
-    else:
-        print('Cached time too fast to measure accurately.')
+    uncached = run_benchmark(scenario, user_ids, dataset=None, cached=False, repeat=repeat)
+    cached = run_benchmark(scenario, user_ids, dataset=None, cached=True, repeat=repeat)
+    speedup = uncached['median_ms'] / max(cached['median_ms'], 1e-9)
 
-    print(f"Cache Hits: {stats['hits']} | Misses: {stats['misses']} | Hit Rate: {stats['hit_rate']}%")
+    print(f"[Uncached] Median: {uncached['median_ms']:.2f} ms (95% CI {uncached['ci95_ms'][0]:.2f}-{uncached['ci95_ms'][1]:.2f})")
+    print(f"[Cached] Median: {cached['median_ms']:.2f} ms (95% CI {cached['ci95_ms'][0]:.2f}-{cached['ci95_ms'][1]:.2f})")
+    print(f'Speedup Factor: {speedup:.2f}x')
+    print(f"Cache Hit Rate: {cached['hit_rate']}%")
 
     return {
         'Scenario': description,
-        'Uncached Time (s)': round(uncached_time, 4),
-        'Cached Time (s)': round(cached_time, 4),
-        'Speedup': round(speedup, 2) if cached_time > 0 else float('inf'),
-        'Hit Rate (%)': stats['hit_rate']
+        'Uncached (ms)': uncached['median_ms'],
+        'Cached (ms)': cached['median_ms'],
+        'Speedup': round(speedup, 2),
+        'Hit Rate (%)': cached['hit_rate']
     }
 
 if __name__ == '__main__':
+    # Only when run as a script: pytest collects this file (it matches
+    # *_test.py), and importing it must not touch caching_test.db.
+    db.set_session(database_url='sqlite:///caching_test.db')
     print('=== Caching Performance Comparison ===')
 
     scenarios = [
@@ -70,8 +48,20 @@ if __name__ == '__main__':
         results.append(result)
 
     print('\n=== Summary Table ===')
-    print(f"{'Scenario':<40} | {'Uncached':<8} | {'Cached':<8} | {'Speedup':<8} | {'Hit Rate (%)':<12}")
-    print('-' * 80)
+    print(f"{'Scenario':<42} | {'Uncached':<10} | {'Cached':<10} | {'Speedup':<8} | {'Hit Rate (%)':<12}")
+    print('-' * 94)
     for r in results:
-        print(f"{r['Scenario']:<40} | {r['Uncached Time (s)']:<8}s | {r['Cached Time (s)']:<8}s | "
-              f"{r['Speedup']:<8}x | {r['Hit Rate (%)']:<12}%")
+        print(f"{r['Scenario']:<42} | {r['Uncached (ms)']:<8}ms | {r['Cached (ms)']:<8}ms | "
+              f"{r['Speedup']:<7}x | {r['Hit Rate (%)']:<12}%")
+
+    # The mixed scenario never fills user_orders_cache (maxsize=1000), so
+    # replay it against a smaller cache, alone and with a batch job that
+    # touches every user once between bursts of normal traffic.
+    mixed = scenarios[2][1]
+    scan = list(range(1, 201))
+    polluted = mixed[:500] + scan + mixed[500:] + scan + mixed
+    print('\n=== Hit Rate by Eviction Policy (maxsize=50) ===')
+    print_policy_table([
+        ('Mixed Access', compare_policies(mixed, maxsize=50)),
+        ('Mixed Access + Batch Scans', compare_policies(polluted, maxsize=50)),
+    ])
@@ -0,0 +1,77 @@
+"""Packed form of grouped user orders for user_orders_cache.
+
+get_user_orders_grouped returns ``[{'order_id': ..., 'items': [{'product':
+..., 'quantity': ...}, ...]}, ...]``: one dict per order and per item, about
+300 bytes per item. CompactOrders keeps the same data in a few flat arrays
+plus one interned name per distinct product, and builds the dicts only for
+the orders that are read.
+"""
+import sys
+from array import array
+from collections.abc import Sequence
+
+
+class CompactOrders(Sequence):
+    """
+    Read-only sequence of order dicts backed by packed arrays.
+
+    Indexing and iteration build fresh dicts, so callers may modify what they
+    get without touching the cached value; ``list(orders)`` expands all of it.
+    Compares equal to the equivalent list of dicts.
+    """
+    __slots__ = ('order_ids', 'bounds', 'names', 'name_index', 'quantities')
+
+    def __init__(self, order_ids, bounds, names, name_index, quantities):
+        self.order_ids = order_ids    # array('q'): one per order
+        self.bounds = bounds          # array('q'): order i owns items bounds[i]:bounds[i + 1]
+        self.names = names            # tuple of interned product names
+        self.name_index = name_index  # array('I'): per item, index into names
+        self.quantities = quantities  # array('q'): per item
+
+    @classmethod
+    def from_orders(cls, orders):
+        """Pack a list of ``{'order_id': ..., 'items': [...]}`` dicts."""
+        order_ids, bounds = array('q'), array('q', [0])
+        name_index, quantities = array('I'), array('q')
+        positions = {}
+        for order in orders:
+            order_ids.append(order['order_id'])
+            for item in order['items']:
+                name = item['product']
+                if name not in positions:
+                    positions[name] = len(positions)
+                name_index.append(positions[name])
+                quantities.append(item['quantity'])
+            bounds.append(len(quantities))
+        names = tuple(sys.intern(name) if isinstance(name, str) else name for name in positions)
+        return cls(order_ids, bounds, names, name_index, quantities)
+
+    def __len__(self):
+        return len(self.order_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        order_id = self.order_ids[index]  # raises IndexError past the end
+        names, name_index, quantities = self.names, self.name_index, self.quantities
+        return {
+            'order_id': order_id,
+            'items': [
+                {'product': names[name_index[j]], 'quantity': quantities[j]}
+                for j in range(self.bounds[index], self.bounds[index + 1])
+            ],
+        }
+
+    def __eq__(self, other):
+        if isinstance(other, CompactOrders):
+            return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'CompactOrders({len(self)} orders, {len(self.quantities)} items)'
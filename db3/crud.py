@@ -2,10 +2,27 @@
 from db_config import db
 from models import User, Product, Order, OrderItem
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import select, desc
-from sqlalchemy import func
+from sqlalchemy import select, insert
 from collections import defaultdict
 from sqlalchemy.orm import selectinload
+from itertools import islice
+from product_sales import top_products_query
+
+DEFAULT_BATCH_SIZE = 1000
+
+def _batches(rows, batch_size):
+    """Split an iterable into lists of at most ``batch_size`` items."""
+    iterator = iter(rows)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+def _insert_in_batches(session, model, rows, batch_size):
+    """Insert dict rows with one executemany per batch; return the row count."""
+    count = 0
+    for batch in _batches(rows, batch_size):
+        session.execute(insert(model), batch)
+        count += len(batch)
+    return count
 
 # User CRUD
 def add_user(name, email):
@@ -20,16 +37,28 @@ def add_user(name, email):
 
 def get_user(user_id):
     """Retrieve a user by ID."""
-    with db.session_scope() as session:
+    with db.read_scope() as session:
         user = session.get(User, user_id)
         return user.to_dict() if user else None
 
 def get_all_users():
     """Retrieve all users as a list of dictionaries."""
-    with db.session_scope() as session:
+    with db.read_scope() as session:
         users = session.execute(select(User)).scalars().all()
         return [user.to_dict() for user in users]
 
+def stream_users(batch_size=1000):
+    """
+    Yield all users as lists of up to ``batch_size`` dictionaries.
+
+    Rows are fetched with ``yield_per`` (a server-side cursor where the backend
+    supports one), so memory stays bounded by the batch size.
+    """
+    with db.read_scope() as session:
+        stmt = select(User).order_by(User.id).execution_options(yield_per=batch_size)
+        for users in session.execute(stmt).scalars().partitions():
+            yield [user.to_dict() for user in users]
+
 def update_user(user_id, name=None, email=None):
     """Update a user's name and/or email."""
     with db.session_scope() as session:
@@ -61,16 +90,23 @@ def add_product(name, price):
 
 def get_product(product_id):
     """Retrieve a product by ID."""
-    with db.session_scope() as session:
+    with db.read_scope() as session:
         product = session.get(Product, product_id)
         return product.to_dict() if product else None
 
 def get_all_products():
     """Retrieve all products as a list of dictionaries."""
-    with db.session_scope() as session:
+    with db.read_scope() as session:
         products = session.execute(select(Product)).scalars().all()
         return [product.to_dict() for product in products]
 
+def stream_products(batch_size=1000):
+    """Yield all products as lists of up to ``batch_size`` dictionaries (see ``stream_users``)."""
+    with db.read_scope() as session:
+        stmt = select(Product).order_by(Product.id).execution_options(yield_per=batch_size)
+        for products in session.execute(stmt).scalars().partitions():
+            yield [product.to_dict() for product in products]
+
 def delete_product(product_id):
     """Delete a product by ID."""
     with db.session_scope() as session:
@@ -99,7 +135,7 @@ def add_order_item(order_id, product_id, quantity):
 # Coursera challenges
 def get_user_orders(user_id):
     """Retrieve all orders and items (with quantities) for a given user."""
-    with db.session_scope() as session:
+    with db.read_scope() as session:
         stmt = (
             select(OrderItem)
             .join(Order)
@@ -117,9 +153,31 @@ def get_user_orders(user_id):
             for item in result
         ]
 
+def stream_user_orders(user_id, batch_size=1000):
+    """
+    Yield a user's order items as lists of up to ``batch_size`` dictionaries.
+
+    Same rows as ``get_user_orders``, but the product name is selected in the
+    same query and rows are streamed with ``yield_per``.
+    """
+    with db.read_scope() as session:
+        stmt = (
+            select(OrderItem.order_id, Product.name, OrderItem.quantity)
+            .join(Order)
+            .join(Product)
+            .where(Order.user_id == user_id)
+            .order_by(OrderItem.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for rows in session.execute(stmt).partitions():
+            yield [
+                {'order_id': order_id, 'product': name, 'quantity': quantity}
+                for order_id, name, quantity in rows
+            ]
+
 def get_user_orders_grouped(user_id):
     """Retrieve all orders and their items (with quantities) for a given user, grouped by order_id."""
-    with db.session_scope() as session:
+    with db.read_scope() as session:
         stmt = (
             select(OrderItem)
             .join(Order)
@@ -146,17 +204,11 @@ def get_user_orders_grouped(user_id):
 def get_total_quantity_per_product(limit=5):
     """Aggregate the total quantity ordered per product."""
 
-    with db.session_scope() as session:
-        stmt = (
-            select(Product.name, func.sum(OrderItem.quantity).label('total_quantity'))
-            .join(OrderItem, Product.id == OrderItem.product_id)
-            .group_by(Product.id)
-            .order_by(desc('total_quantity'))
-            .limit(limit)
-        )
-        result = session.execute(stmt).all()
+    with db.read_scope() as session:
+        # Reads the product_sales summary rather than aggregating order_items.
+        result = session.execute(top_products_query(limit)).all()
 
-        return [{'product': name, 'total_quantity': quantity} for name, quantity in result]
+        return [{'product': name, 'total_quantity': quantity} for _, name, quantity in result]
 
 def get_products_paginated(page: int = 1, per_page: int = 3):
     """
@@ -171,7 +223,7 @@ def get_products_paginated(page: int = 1, per_page: int = 3):
     """
     offset_value = (page - 1) * per_page
 
-    with db.session_scope() as session:
+    with db.read_scope() as session:
         stmt = (
             select(OrderItem)
             .options(selectinload(OrderItem.product))  # Eagerly load the product relationship
@@ -191,3 +243,96 @@ def get_products_paginated(page: int = 1, per_page: int = 3):
             }
             for item in results
         ]
+
+def get_products_after(last_id: int = 0, per_page: int = 3):
+    """
+    Retrieve the page of order items that follows ``last_id`` (keyset pagination).
+
+    Unlike ``get_products_paginated`` this seeks on the primary key instead of
+    skipping ``OFFSET`` rows, so every page costs the same however deep it is.
+
+    Args:
+        last_id (int): The ``id`` of the last order item already seen (0 to start).
+        per_page (int): Number of records per page.
+
+    Returns:
+        List[dict]: Up to ``per_page`` order item dictionaries with ``id > last_id``.
+    """
+    with db.read_scope() as session:
+        stmt = (
+            select(OrderItem)
+            .options(selectinload(OrderItem.product))
+            .where(OrderItem.id > last_id)
+            .order_by(OrderItem.id)
+            .limit(per_page)
+        )
+        results = session.execute(stmt).scalars().all()
+
+        return [
+            {
+                'id': item.id,
+                'order_id': item.order_id,
+                'product_id': item.product_id,
+                'product_name': item.product.name,
+                'quantity': item.quantity
+            }
+            for item in results
+        ]
+
+def iter_products(per_page: int = 100):
+    """
+    Yield every order item dictionary in ``id`` order, one keyset page at a time.
+
+    Args:
+        per_page (int): Number of records fetched per query.
+    """
+    last_id = 0
+    while True:
+        page = get_products_after(last_id=last_id, per_page=per_page)
+        yield from page
+        if len(page) < per_page:
+            return
+        last_id = page[-1]['id']
+
+# Bulk writes: one transaction, one executemany per batch
+def add_users_bulk(users, batch_size=DEFAULT_BATCH_SIZE):
+    """Add many users from ``(name, email)`` pairs; all or nothing."""
+    try:
+        with db.session_scope() as session:
+            count = _insert_in_batches(
+                session, User, ({'name': name, 'email': email} for name, email in users), batch_size
+            )
+            return f'{count} users added.'
+    except IntegrityError:
+        return 'One or more emails already exist; no users added.'
+
+def add_products_bulk(products, batch_size=DEFAULT_BATCH_SIZE):
+    """Add many products from ``(name, price)`` pairs."""
+    with db.session_scope() as session:
+        count = _insert_in_batches(
+            session, Product, ({'name': name, 'price': price} for name, price in products), batch_size
+        )
+        return f'{count} products added.'
+
+def add_orders_bulk(user_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """Create one order per user ID; return the new order IDs in the same order."""
+    order_ids = []
+    with db.session_scope() as session:
+        stmt = insert(Order).returning(Order.id, sort_by_parameter_order=True)
+        for batch in _batches(({'user_id': user_id} for user_id in user_ids), batch_size):
+            order_ids.extend(session.scalars(stmt, batch))
+    return order_ids
+
+def add_order_items_bulk(items, batch_size=DEFAULT_BATCH_SIZE):
+    """Add many order items from ``(order_id, product_id, quantity)`` triples."""
+    with db.session_scope() as session:
+        count = _insert_in_batches(
+            session,
+            OrderItem,
+            (
+                {'order_id': order_id, 'product_id': product_id, 'quantity': quantity}
+                for order_id, product_id, quantity in items
+            ),
+            batch_size,
+        )
+        return f'{count} order items added.'
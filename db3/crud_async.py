@@ -0,0 +1,169 @@
+"""Async CRUD operations for the ecommerce database models (twins of crud.py)."""
+from db_config import db
+from models import User, Product, Order, OrderItem
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select
+from collections import defaultdict
+from sqlalchemy.orm import selectinload
+from product_sales import top_products_query
+
+# Async sessions cannot lazy-load relationships, so every query below selects
+# the columns it needs or eager-loads them.
+
+# User CRUD
+async def add_user(name, email):
+    """Add a new user with a unique email."""
+    try:
+        async with db.async_session_scope() as session:
+            new_user = User(name=name, email=email)
+            session.add(new_user)
+            return f'User {name!r} added.'
+    except IntegrityError:
+        return f'User with email {email!r} already exists.'
+
+async def get_user(user_id):
+    """Retrieve a user by ID."""
+    async with db.async_session_scope() as session:
+        user = await session.get(User, user_id)
+        return user.to_dict() if user else None
+
+async def get_all_users():
+    """Retrieve all users as a list of dictionaries."""
+    async with db.async_session_scope() as session:
+        users = (await session.execute(select(User))).scalars().all()
+        return [user.to_dict() for user in users]
+
+async def update_user(user_id, name=None, email=None):
+    """Update a user's name and/or email."""
+    async with db.async_session_scope() as session:
+        user = await session.get(User, user_id)
+        if user:
+            if name:
+                user.name = name
+            if email:
+                user.email = email
+            return f'User {user_id} updated.'
+        return f'User {user_id} not found.'
+
+async def delete_user(user_id):
+    """Delete a user by ID."""
+    async with db.async_session_scope() as session:
+        user = await session.get(User, user_id)
+        if user:
+            await session.delete(user)
+            return f'User {user_id} deleted.'
+        return f'User {user_id} not found.'
+
+# Product CRUD
+async def add_product(name, price):
+    """Add a new product with a name and price."""
+    async with db.async_session_scope() as session:
+        new_product = Product(name=name, price=price)
+        session.add(new_product)
+        return f'Product {name!r} added.'
+
+async def get_product(product_id):
+    """Retrieve a product by ID."""
+    async with db.async_session_scope() as session:
+        product = await session.get(Product, product_id)
+        return product.to_dict() if product else None
+
+async def get_all_products():
+    """Retrieve all products as a list of dictionaries."""
+    async with db.async_session_scope() as session:
+        products = (await session.execute(select(Product))).scalars().all()
+        return [product.to_dict() for product in products]
+
+async def delete_product(product_id):
+    """Delete a product by ID."""
+    async with db.async_session_scope() as session:
+        product = await session.get(Product, product_id)
+        if product:
+            await session.delete(product)
+            return f'Product {product_id} deleted.'
+        return f'Product {product_id} not found.'
+
+# Order CRUD
+async def add_order(user_id):
+    """Create a new order for a given user ID."""
+    async with db.async_session_scope() as session:
+        new_order = Order(user_id=user_id)
+        session.add(new_order)
+        await session.flush()  # Assigns new_order.id
+        return new_order.id
+
+async def add_order_item(order_id, product_id, quantity):
+    """Add an item to an order with specified quantity."""
+    async with db.async_session_scope() as session:
+        new_item = OrderItem(order_id=order_id, product_id=product_id, quantity=quantity)
+        session.add(new_item)
+        return f'Added product {product_id} to order {order_id}.'
+
+# Coursera challenges
+def _user_order_rows(user_id):
+    return (
+        select(OrderItem.order_id, OrderItem.product_id, Product.name, OrderItem.quantity)
+        .join(Order)
+        .join(Product)
+        .where(Order.user_id == user_id)
+        .order_by(OrderItem.order_id, OrderItem.id)
+    )
+
+async def get_user_orders(user_id):
+    """Retrieve all orders and items (with quantities) for a given user."""
+    async with db.async_session_scope() as session:
+        result = await session.execute(_user_order_rows(user_id))
+        return [
+            {'order_id': order_id, 'product': name, 'quantity': quantity}
+            for order_id, _, name, quantity in result
+        ]
+
+async def get_user_orders_grouped(user_id):
+    """Retrieve all orders and their items (with quantities) for a given user, grouped by order_id."""
+    async with db.async_session_scope() as session:
+        result = await session.execute(_user_order_rows(user_id))
+        grouped = defaultdict(list)
+        for order_id, _, name, quantity in result:
+            grouped[order_id].append({'product': name, 'quantity': quantity})
+        return [{'order_id': order_id, 'items': items} for order_id, items in grouped.items()]
+
+async def get_total_quantity_per_product(limit=5):
+    """Aggregate the total quantity ordered per product."""
+    async with db.async_session_scope() as session:
+        result = await session.execute(top_products_query(limit))
+        return [{'product': name, 'total_quantity': quantity} for _, name, quantity in result]
+
+def _order_item_row(item):
+    return {
+        'id': item.id,
+        'order_id': item.order_id,
+        'product_id': item.product_id,
+        'product_name': item.product.name,
+        'quantity': item.quantity
+    }
+
+async def get_products_paginated(page: int = 1, per_page: int = 3):
+    """Retrieve paginated order items, including product names (see crud.get_products_paginated)."""
+    async with db.async_session_scope() as session:
+        stmt = (
+            select(OrderItem)
+            .options(selectinload(OrderItem.product))
+            .order_by(OrderItem.id)
+            .limit(per_page)
+            .offset((page - 1) * per_page)
+        )
+        results = (await session.execute(stmt)).scalars().all()
+        return [_order_item_row(item) for item in results]
+
+async def get_products_after(last_id: int = 0, per_page: int = 3):
+    """Retrieve the page of order items that follows ``last_id`` (see crud.get_products_after)."""
+    async with db.async_session_scope() as session:
+        stmt = (
+            select(OrderItem)
+            .options(selectinload(OrderItem.product))
+            .where(OrderItem.id > last_id)
+            .order_by(OrderItem.id)
+            .limit(per_page)
+        )
+        results = (await session.execute(stmt)).scalars().all()
+        return [_order_item_row(item) for item in results]
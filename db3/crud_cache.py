@@ -2,34 +2,202 @@
 from db_config import db
 from models import User, Product, Order, OrderItem
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import select, desc
+from sqlalchemy import select, event, inspect
 from sqlalchemy import func
 from collections import defaultdict
-from sqlalchemy.orm import selectinload
-from cachetools import TTLCache, cached, keys
+from sqlalchemy.orm import selectinload, Session
+from cachetools import TTLCache, keys
 from functools import partial
 
-from cache_utils import InstrumentedCache
+import json
+import os
 
-product_cache = InstrumentedCache(maxsize=100, ttl=300)
-user_orders_cache = InstrumentedCache(maxsize=1000, ttl=120)
+from cache_utils import ConcurrentInstrumentedCache, cached, depends_on, invalidate
+from cache_backends import backend_from_url
+from product_sales import top_products_query
+from crud import add_users_bulk, add_products_bulk, add_orders_bulk, add_order_items_bulk
+from crud import DEFAULT_BATCH_SIZE, _batches
+from cache_warmup import register_warmer
+from cache_filters import IdBitmap
+from compact_orders import CompactOrders
 
-# Key function for paginated products
+# Optional shared L2 tier, e.g. CACHE_L2_URL=sqlite:///cache.db or redis://localhost:6379/0
+cache_l2_url = os.getenv('CACHE_L2_URL')
+
+
+def _max_bytes(variable):
+    """Optional byte budget for a cache from the environment, e.g. USER_ORDERS_CACHE_MAX_BYTES=50000000."""
+    value = os.getenv(variable)
+    return int(value) if value else None
+
+
+product_cache = ConcurrentInstrumentedCache(
+    maxsize=100, ttl=300, name='product_cache', l2=backend_from_url(cache_l2_url, 'product_cache'),
+    policy=os.getenv('PRODUCT_CACHE_POLICY', 'lru'), max_bytes=_max_bytes('PRODUCT_CACHE_MAX_BYTES')
+)
+user_orders_cache = ConcurrentInstrumentedCache(
+    maxsize=1000, ttl=120, name='user_orders_cache', l2=backend_from_url(cache_l2_url, 'user_orders_cache'),
+    policy=os.getenv('USER_ORDERS_CACHE_POLICY', 'lru'), max_bytes=_max_bytes('USER_ORDERS_CACHE_MAX_BYTES')
+)
+# USER_ORDERS_CACHE_COMPACT=1 stores grouped orders as CompactOrders: a
+# fraction of the memory, with order dicts built only when read.
+compact_user_orders = os.getenv('USER_ORDERS_CACHE_COMPACT') == '1'
+# Single users and products, including None for ids that do not exist.
+record_cache = ConcurrentInstrumentedCache(
+    maxsize=1000, ttl=300, name='record_cache', l2=backend_from_url(cache_l2_url, 'record_cache'),
+    policy=os.getenv('RECORD_CACHE_POLICY', 'lru'), max_bytes=_max_bytes('RECORD_CACHE_MAX_BYTES')
+)
+
+# Key functions; product_cache is shared, so each function's keys get a prefix
 product_page_key = lambda page, per_page: f'page:{page}_per_page:{per_page}'
 
 
+# ---- Dependency tags ----
+# A cached entry declares what it was built from with depends_on(); a commit
+# invalidates the entries whose tags match the rows it flushed:
+#   (table, row_id)         - a specific row was inserted, updated or deleted
+#   (table, op)             - some row of the table was inserted/updated/deleted
+#   ('orders.user_id', id)  - an order or order item of that user changed
+def table_tags(table):
+    """Tags matching any change to ``table``."""
+    return (table, 'insert'), (table, 'update'), (table, 'delete')
+
+
+def _user_ids_of_orders(session, order_ids):
+    return session.execute(
+        select(Order.user_id).where(Order.id.in_(order_ids))
+    ).scalars().all()
+
+
+def _write_tags(session, obj, op):
+    """Tags invalidated by flushing ``obj`` as an insert, update or delete."""
+    table = obj.__tablename__
+    tags = {(table, obj.id), (table, op)}
+    state = inspect(obj)
+    if isinstance(obj, Order):
+        user_ids = {obj.user_id, *state.attrs.user_id.history.deleted}
+        tags.update(('orders.user_id', user_id) for user_id in user_ids)
+    elif isinstance(obj, OrderItem):
+        order_ids = {obj.order_id, *state.attrs.order_id.history.deleted}
+        for user_id in _user_ids_of_orders(session, order_ids):
+            tags.add(('orders.user_id', user_id))
+    return tags
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_write_tags(session, flush_context):
+    tags = session.info.setdefault('cache_tags', set())
+    for obj in session.new:
+        tags.update(_write_tags(session, obj, 'insert'))
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            tags.update(_write_tags(session, obj, 'update'))
+    for obj in session.deleted:
+        tags.update(_write_tags(session, obj, 'delete'))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_insert_tags(orm_execute_state):
+    # Bulk INSERT statements (see the *_bulk functions) bypass the unit of
+    # work, so after_flush never sees their rows; tag them from the parameters,
+    # and tag every id between the highest id before and after the statement,
+    # which covers the new rows (and at worst a few concurrent inserts).
+    # The tags are applied once, by after_commit, for the whole transaction.
+    if not orm_execute_state.is_insert or orm_execute_state.bind_mapper is None:
+        return
+    session = orm_execute_state.session
+    model = orm_execute_state.bind_mapper.class_
+    table = model.__tablename__
+    params = orm_execute_state.parameters
+    rows = params if isinstance(params, list) else [params or {}]
+    tags = session.info.setdefault('cache_tags', set())
+    tags.add((table, 'insert'))
+    if model is Order:
+        tags.update(('orders.user_id', row.get('user_id')) for row in rows)
+    elif model is OrderItem:
+        order_ids = {row.get('order_id') for row in rows}
+        tags.update(('orders.user_id', user_id) for user_id in _user_ids_of_orders(session, order_ids))
+    max_id = select(func.coalesce(func.max(model.id), 0))
+    first_id = session.scalar(max_id) + 1
+    result = orm_execute_state.invoke_statement()
+    tags.update((table, row_id) for row_id in range(first_id, session.scalar(max_id) + 1))
+    return result
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    invalidate(*session.info.pop('cache_tags', ()))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop('cache_tags', None)
+
+
+# ---- Existence filters ----
+# Bitmaps of live user/product ids, so lookups of ids that do not exist
+# (e.g. scrapers probing ids) never reach the database. Only commits made by
+# this process update them, so enable them (CACHE_ID_FILTER=1) only where
+# this process is the sole writer.
+def _all_ids(model):
+    with db.read_scope() as session:
+        return session.execute(select(model.id)).scalars().all()
+
+
+id_filter_enabled = os.getenv('CACHE_ID_FILTER') == '1'
+id_filters = {
+    'users': IdBitmap(partial(_all_ids, User), enabled=id_filter_enabled),
+    'products': IdBitmap(partial(_all_ids, Product), enabled=id_filter_enabled),
+}
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_id_changes(session, flush_context):
+    changes = session.info.setdefault('id_changes', [])
+    for objects, live in ((session.new, True), (session.deleted, False)):
+        for obj in objects:
+            if obj.__tablename__ in id_filters:
+                changes.append((obj.__tablename__, obj.id, live))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_id_changes(orm_execute_state):
+    # Bulk inserts do not return the new ids; reload the bitmap instead.
+    if orm_execute_state.is_insert and orm_execute_state.bind_mapper is not None:
+        table = orm_execute_state.bind_mapper.class_.__tablename__
+        if table in id_filters:
+            orm_execute_state.session.info.setdefault('id_changes', []).append((table, None, None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_id_changes(session):
+    for table, id_, live in session.info.pop('id_changes', ()):
+        if id_ is None:
+            id_filters[table].reset()
+        elif live:
+            id_filters[table].add(id_)
+        else:
+            id_filters[table].discard(id_)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_id_changes(session):
+    session.info.pop('id_changes', None)
+
+
 # ---- Cached Functions ----
-@cached(cache=product_cache)
+@cached(cache=product_cache, key=partial(keys.hashkey, 'all_products'))
 def get_all_products():
-    with db.session_scope() as session:
+    with db.read_scope() as session:
         products = session.execute(select(Product)).scalars().all()
+        depends_on(*table_tags('products'))
         return [product.to_dict() for product in products]
 
 
 @cached(cache=product_cache, key=product_page_key)
 def get_products_paginated(page: int = 1, per_page: int = 3):
     offset_value = (page - 1) * per_page
-    with db.session_scope() as session:
+    with db.read_scope() as session:
         stmt = (
             select(OrderItem)
             .options(selectinload(OrderItem.product))
@@ -39,6 +207,14 @@ def get_products_paginated(page: int = 1, per_page: int = 3):
         )
         results = session.execute(stmt).scalars().all()
 
+        # Ids only grow, so inserts can only change the last (partial) page;
+        # a delete anywhere shifts every page after it.
+        depends_on(('order_items', 'delete'))
+        if len(results) < per_page:
+            depends_on(('order_items', 'insert'))
+        for item in results:
+            depends_on(('order_items', item.id), ('products', item.product_id))
+
         return [
             {
                 'id': item.id,
@@ -51,53 +227,219 @@ def get_products_paginated(page: int = 1, per_page: int = 3):
         ]
 
 
-@cached(cache=product_cache)
+product_after_key = lambda last_id=0, per_page=3: f'after:{last_id}_per_page:{per_page}'
+
+
+def _product_page_query(last_id, per_page):
+    return (
+        select(OrderItem)
+        .options(selectinload(OrderItem.product))
+        .where(OrderItem.id > last_id)
+        .order_by(OrderItem.id)
+        .limit(per_page)
+    )
+
+
+def _order_item_row(item):
+    return {
+        'id': item.id,
+        'order_id': item.order_id,
+        'product_id': item.product_id,
+        'product_name': item.product.name,
+        'quantity': item.quantity
+    }
+
+
+@cached(cache=product_cache, key=product_after_key)
+def get_products_after(last_id: int = 0, per_page: int = 3):
+    """Keyset-paginated order items with ``id > last_id``; constant cost at any depth."""
+    with db.read_scope() as session:
+        results = session.execute(_product_page_query(last_id, per_page)).scalars().all()
+
+        # A seek page holds the consecutive rows after last_id, so deletes
+        # elsewhere never shift it; inserts only reach a partial (last) page.
+        if len(results) < per_page:
+            depends_on(('order_items', 'insert'))
+        for item in results:
+            depends_on(('order_items', item.id), ('products', item.product_id))
+
+        return [_order_item_row(item) for item in results]
+
+
+def iter_products(per_page: int = 100):
+    """
+    Yield every order item dictionary in ``id`` order, one keyset page at a time.
+
+    Pages are read straight from the database: a full scan would only evict
+    the hot entries from product_cache.
+    """
+    last_id = 0
+    while True:
+        with db.read_scope() as session:
+            page = [
+                _order_item_row(item)
+                for item in session.execute(_product_page_query(last_id, per_page)).scalars()
+            ]
+        yield from page
+        if len(page) < per_page:
+            return
+        last_id = page[-1]['id']
+
+
+@cached(cache=product_cache, key=partial(keys.hashkey, 'total_quantity'))
 def get_total_quantity_per_product(limit=5):
-    with db.session_scope() as session:
-        stmt = (
-            select(Product.name, func.sum(OrderItem.quantity).label('total_quantity'))
-            .join(OrderItem, Product.id == OrderItem.product_id)
-            .group_by(Product.id)
-            .order_by(desc('total_quantity'))
-            .limit(limit)
-        )
-        result = session.execute(stmt).all()
-        return [{'product': name, 'total_quantity': quantity} for name, quantity in result]
+    with db.read_scope() as session:
+        result = session.execute(top_products_query(limit)).all()
+        depends_on(*table_tags('order_items'))
+        depends_on(*(('products', product_id) for product_id, _, _ in result))
+        return [{'product': name, 'total_quantity': quantity} for _, name, quantity in result]
+
+
+def _user_order_rows(user_id):
+    # Projection: product names come from the join itself, not from lazy
+    # loading item.product once per row (N+1 queries).
+    return (
+        select(OrderItem.order_id, OrderItem.product_id, Product.name, OrderItem.quantity)
+        .join(Order)
+        .join(Product)
+        .where(Order.user_id == user_id)
+        .order_by(OrderItem.order_id, OrderItem.id)
+    )
+
+
+def _packed(orders):
+    """The form user_orders_cache stores ``orders`` in: CompactOrders when enabled."""
+    return CompactOrders.from_orders(orders) if compact_user_orders else orders
 
 
 @cached(cache=user_orders_cache, key=lambda user_id: user_id)
 def get_user_orders_grouped(user_id):
-    with db.session_scope() as session:
+    with db.read_scope() as session:
+        rows = session.execute(_user_order_rows(user_id))
+        depends_on(('orders.user_id', user_id))
+        grouped = defaultdict(list)
+        for order_id, product_id, name, quantity in rows:
+            depends_on(('products', product_id))
+            grouped[order_id].append({'product': name, 'quantity': quantity})
+        return _packed([{'order_id': oid, 'items': items} for oid, items in grouped.items()])
+
+
+@cached(cache=user_orders_cache, key=lambda user_id: ('json', user_id))
+def get_user_orders_grouped_json(user_id):
+    """
+    Same result as get_user_orders_grouped, grouped by SQLite itself.
+
+    Each order comes back as one row whose items were built with
+    json_group_array/json_object, so Python only decodes one JSON array per
+    order. Requires SQLite's JSON functions.
+    """
+    with db.read_scope() as session:
         stmt = (
-            select(OrderItem)
+            select(
+                OrderItem.order_id,
+                func.json_group_array(
+                    func.json_object('product', Product.name, 'quantity', OrderItem.quantity)
+                ),
+                func.json_group_array(Product.id),
+            )
             .join(Order)
             .join(Product)
             .where(Order.user_id == user_id)
+            .group_by(OrderItem.order_id)
+            .order_by(OrderItem.order_id)
         )
-        order_items = session.execute(stmt).scalars().all()
-        from collections import defaultdict
-        grouped = defaultdict(list)
-        for item in order_items:
-            grouped[item.order_id].append({
-                'product': item.product.name,
-                'quantity': item.quantity
-            })
-        return [{'order_id': oid, 'items': items} for oid, items in grouped.items()]
+        depends_on(('orders.user_id', user_id))
+        result = []
+        for order_id, items, product_ids in session.execute(stmt):
+            depends_on(*(('products', product_id) for product_id in json.loads(product_ids)))
+            result.append({'order_id': order_id, 'items': json.loads(items)})
+        return _packed(result)
+
+def _user_orders_grouped_many(user_ids):
+    """
+    ``{user_id: (grouped orders, tags)}`` for ``user_ids``, the same values
+    get_user_orders_grouped builds one user at a time, from one ``IN`` query
+    per DEFAULT_BATCH_SIZE users.
+    """
+    loaded = {}
+    with db.read_scope() as session:
+        for batch in _batches(user_ids, DEFAULT_BATCH_SIZE):
+            stmt = (
+                select(Order.user_id, OrderItem.order_id, OrderItem.product_id, Product.name, OrderItem.quantity)
+                .join(Order)
+                .join(Product)
+                .where(Order.user_id.in_(batch))
+                .order_by(Order.user_id, OrderItem.order_id, OrderItem.id)
+            )
+            grouped = {user_id: defaultdict(list) for user_id in batch}
+            tags = {user_id: {('orders.user_id', user_id)} for user_id in batch}
+            for user_id, order_id, product_id, name, quantity in session.execute(stmt):
+                tags[user_id].add(('products', product_id))
+                grouped[user_id][order_id].append({'product': name, 'quantity': quantity})
+            for user_id in batch:
+                orders = [{'order_id': oid, 'items': items} for oid, items in grouped[user_id].items()]
+                loaded[user_id] = (_packed(orders), tags[user_id])
+    return loaded
+
+
+def _load_user_orders(keys):
+    """user_orders_cache.load_many() loader for both key forms: user_id and ('json', user_id)."""
+    user_id_of = lambda key: key[1] if isinstance(key, tuple) else key
+    loaded = _user_orders_grouped_many(list(dict.fromkeys(map(user_id_of, keys))))
+    return {key: loaded[user_id_of(key)] for key in keys}
+
+
+def get_user_orders_grouped_many(user_ids):
+    """
+    ``{user_id: grouped orders}`` for many users at once, e.g. for a dashboard.
+
+    Users already in user_orders_cache are served from it; all the others
+    are read with a single ``WHERE user_id IN (...)`` query (per 1000
+    users), grouped in one pass and cached under the same keys as
+    get_user_orders_grouped.
+    """
+    return user_orders_cache.load_many(user_ids, _load_user_orders)
+
+
+# ---- Warm-up (see cache_warmup) ----
+def _warm_user_orders(keys):
+    return len(user_orders_cache.load_many(keys, _load_user_orders))
 
+
+def _warm_products(keys):
+    # product_cache holds a few dozen small entries, so replaying each
+    # snapshotted call is cheap; the keys are parsed back into arguments.
+    loaded = 0
+    for key in keys:
+        if key == ('all_products',):
+            get_all_products()
+        elif isinstance(key, tuple) and key[:1] == ('total_quantity',):
+            get_total_quantity_per_product(*key[1:])
+        elif isinstance(key, str) and key.startswith(('page:', 'after:')):
+            kind, rest = key.split(':', 1)
+            first, per_page = (int(part) for part in rest.split('_per_page:'))
+            (get_products_paginated if kind == 'page' else get_products_after)(first, per_page)
+        else:
+            continue
+        loaded += 1
+    return loaded
+
+
+register_warmer(user_orders_cache, _warm_user_orders)
+register_warmer(product_cache, _warm_products)
+
+# Writes need no manual invalidation: the session events above drop exactly
+# the entries that depend on the rows they flushed once they commit.
 def add_product(name, price):
     with db.session_scope() as session:
         new_product = Product(name=name, price=price)
         session.add(new_product)
-        product_cache.clear()  # invalidate all product caches
         return f'Product {name!r} added.'
 
 def add_order_item(order_id, product_id, quantity):
     with db.session_scope() as session:
         new_item = OrderItem(order_id=order_id, product_id=product_id, quantity=quantity)
         session.add(new_item)
-        user_id = session.get(Order, order_id).user_id
-        user_orders_cache.pop(user_id, None)  # invalidate only for this user
-        product_cache.clear()  # also affects product aggregates
         return f'Added product {product_id} to order {order_id}.'
 
 # User CRUD
@@ -112,14 +454,23 @@ def add_user(name, email):
         return f'User with email {email!r} already exists.'
 
 def get_user(user_id):
-    """Retrieve a user by ID."""
-    with db.session_scope() as session:
+    """Retrieve a user by ID; ids that do not exist are cached as None too."""
+    if user_id not in id_filters['users']:
+        return None
+    return _get_user(user_id)
+
+@cached(cache=record_cache, key=lambda user_id: ('users', user_id))
+def _get_user(user_id):
+    with db.read_scope() as session:
         user = session.get(User, user_id)
-        return user.to_dict() if user else None
+        depends_on(('users', user_id))
+        if user is None:
+            return None
+        return user.to_dict()
 
 def get_all_users():
     """Retrieve all users as a list of dictionaries."""
-    with db.session_scope() as session:
+    with db.read_scope() as session:
         users = session.execute(select(User)).scalars().all()
         return [user.to_dict() for user in users]
 
@@ -145,10 +496,19 @@ def delete_user(user_id):
         return f'User {user_id} not found.'
 
 def get_product(product_id):
-    """Retrieve a product by ID."""
-    with db.session_scope() as session:
+    """Retrieve a product by ID; ids that do not exist are cached as None too."""
+    if product_id not in id_filters['products']:
+        return None
+    return _get_product(product_id)
+
+@cached(cache=record_cache, key=lambda product_id: ('products', product_id))
+def _get_product(product_id):
+    with db.read_scope() as session:
         product = session.get(Product, product_id)
-        return product.to_dict() if product else None
+        depends_on(('products', product_id))
+        if product is None:
+            return None
+        return product.to_dict()
 
 
 def delete_product(product_id):
@@ -173,7 +533,7 @@ def add_order(user_id):
 # Coursera challenges
 def get_user_orders(user_id):
     """Retrieve all orders and items (with quantities) for a given user."""
-    with db.session_scope() as session:
+    with db.read_scope() as session:
         stmt = (
             select(OrderItem)
             .join(Order)
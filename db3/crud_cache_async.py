@@ -0,0 +1,92 @@
+"""Async twins of the cached functions in crud_cache.py.
+
+They share product_cache and user_orders_cache (and their keys) with the
+sync versions, and writes made through either API invalidate both, since
+the session events in crud_cache also fire for the sync session inside
+every AsyncSession.
+"""
+from db_config import db
+from models import Product, OrderItem
+from sqlalchemy import select
+from collections import defaultdict
+from sqlalchemy.orm import selectinload
+from cachetools import keys
+from functools import partial
+
+from cache_utils import cached_async, depends_on
+from product_sales import top_products_query
+from crud_cache import product_cache, user_orders_cache, product_page_key, product_after_key, table_tags, _packed
+from crud_async import (
+    add_user, get_user, get_all_users, update_user, delete_user, add_product, get_product,
+    delete_product, add_order, add_order_item, get_user_orders, _order_item_row, _user_order_rows,
+)
+
+
+@cached_async(cache=product_cache, key=partial(keys.hashkey, 'all_products'))
+async def get_all_products():
+    async with db.async_session_scope() as session:
+        products = (await session.execute(select(Product))).scalars().all()
+        depends_on(*table_tags('products'))
+        return [product.to_dict() for product in products]
+
+
+@cached_async(cache=product_cache, key=product_page_key)
+async def get_products_paginated(page: int = 1, per_page: int = 3):
+    async with db.async_session_scope() as session:
+        stmt = (
+            select(OrderItem)
+            .options(selectinload(OrderItem.product))
+            .order_by(OrderItem.id)
+            .limit(per_page)
+            .offset((page - 1) * per_page)
+        )
+        results = (await session.execute(stmt)).scalars().all()
+
+        depends_on(('order_items', 'delete'))
+        if len(results) < per_page:
+            depends_on(('order_items', 'insert'))
+        for item in results:
+            depends_on(('order_items', item.id), ('products', item.product_id))
+
+        return [_order_item_row(item) for item in results]
+
+
+@cached_async(cache=product_cache, key=product_after_key)
+async def get_products_after(last_id: int = 0, per_page: int = 3):
+    async with db.async_session_scope() as session:
+        stmt = (
+            select(OrderItem)
+            .options(selectinload(OrderItem.product))
+            .where(OrderItem.id > last_id)
+            .order_by(OrderItem.id)
+            .limit(per_page)
+        )
+        results = (await session.execute(stmt)).scalars().all()
+
+        if len(results) < per_page:
+            depends_on(('order_items', 'insert'))
+        for item in results:
+            depends_on(('order_items', item.id), ('products', item.product_id))
+
+        return [_order_item_row(item) for item in results]
+
+
+@cached_async(cache=product_cache, key=partial(keys.hashkey, 'total_quantity'))
+async def get_total_quantity_per_product(limit=5):
+    async with db.async_session_scope() as session:
+        result = (await session.execute(top_products_query(limit))).all()
+        depends_on(*table_tags('order_items'))
+        depends_on(*(('products', product_id) for product_id, _, _ in result))
+        return [{'product': name, 'total_quantity': quantity} for _, name, quantity in result]
+
+
+@cached_async(cache=user_orders_cache, key=lambda user_id: user_id)
+async def get_user_orders_grouped(user_id):
+    async with db.async_session_scope() as session:
+        result = await session.execute(_user_order_rows(user_id))
+        depends_on(('orders.user_id', user_id))
+        grouped = defaultdict(list)
+        for order_id, product_id, name, quantity in result:
+            depends_on(('products', product_id))
+            grouped[order_id].append({'product': name, 'quantity': quantity})
+        return _packed([{'order_id': oid, 'items': items} for oid, items in grouped.items()])
@@ -1,36 +1,257 @@
 # db_config.py
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base, Session as SessionType
-from contextlib import contextmanager
-from typing import Generator
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncGenerator, Generator
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+from cache_metrics import LatencyHistogram
+from query_stats import QueryStats, skip_caller_file
+
 load_dotenv()
 
+# Applied to every new SQLite connection by the 'performance' profile.
+SQLITE_PERFORMANCE_PRAGMAS = {
+    'journal_mode': 'WAL',        # readers no longer block on the writer
+    'synchronous': 'NORMAL',      # fsync at checkpoints only; safe with WAL
+    'cache_size': -64000,         # 64 MiB page cache per connection
+    'mmap_size': 268435456,       # 256 MiB memory-mapped I/O
+    'temp_store': 'MEMORY',
+}
+
+# Engine options of the 'performance' profile, per backend.
+SQLITE_PERFORMANCE_ENGINE = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+    'connect_args': {'check_same_thread': False, 'timeout': 30},
+}
+SERVER_PERFORMANCE_ENGINE = {
+    'pool_size': 20,
+    'max_overflow': 40,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+}
+
+# Applied to the connections of the SQLite read engine (see DatabaseConfig.read_scope).
+SQLITE_READ_PRAGMAS = {
+    'query_only': 'ON',           # any write fails instead of taking the write lock
+}
+
+PROFILES = ('default', 'performance')
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a connection.
+
+    Only the wait counts: when a checkout opens a new (overflow) connection,
+    the time spent connecting and running the connect hooks (e.g. pragmas)
+    is left out.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_times = LatencyHistogram()
+        self._checkout = threading.local()
+
+    def _do_get(self):
+        checkout = self._checkout
+        if getattr(checkout, 'start', None) is not None:
+            return super()._do_get()  # QueuePool._do_get retrying itself
+        checkout.start, checkout.connecting = time.perf_counter(), 0.0
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_times.observe(time.perf_counter() - checkout.start - checkout.connecting)
+            checkout.start = None
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            if getattr(self._checkout, 'start', None) is not None:
+                self._checkout.connecting += time.perf_counter() - start
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.wait_times = self.wait_times
+        return pool
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
 class DatabaseConfig:
     def __init__(self):
         self.engine = None
         self.Session = None
+        self.read_engine = None
+        self.ReadSession = None
+        self.async_engine = None
+        self.AsyncSession = None
+        self.query_stats = None
         self.Base = declarative_base()
 
-    def set_session(self, database_url=None, echo=False):
+    def set_session(self, database_url=None, echo=False, profile=None, read_url=None, **engine_options):
         """
         Initialize the SQLAlchemy engine and sessionmaker with the given database URL.
 
         Args:
             database_url (str): Database connection string.
             echo (bool): If True, SQLAlchemy will log all SQL statements.
+            profile (str): ``'default'`` keeps SQLAlchemy's defaults; ``'performance'``
+                sizes the connection pool for the backend, times pool checkouts
+                (see ``pool_stats``) and, on SQLite, applies
+                ``SQLITE_PERFORMANCE_PRAGMAS`` to every new connection.
+                Falls back to the ``DATABASE_PROFILE`` environment variable.
+            read_url (str): Where ``read_scope`` sessions connect, e.g. a replica.
+                Falls back to ``DATABASE_READ_URL``; without either, a SQLite file
+                gets its own pool of query-only connections and any other
+                database is read through the main engine.
+            **engine_options: Extra ``create_engine`` arguments; they override the profile.
 
         Returns:
             sessionmaker: A configured session factory.
         """
         db_url = database_url or os.getenv('DATABASE_URL', 'sqlite:///ecommerce.db')
-        self.engine = create_engine(db_url, echo=echo)
+        profile = profile or os.getenv('DATABASE_PROFILE', 'default')
+        if profile not in PROFILES:
+            raise ValueError(f'Unknown database profile {profile!r}; expected one of {PROFILES}.')
+
+        url = make_url(db_url)
+        is_sqlite = url.get_backend_name() == 'sqlite'
+        options = {}
+        # In-memory SQLite needs its single shared connection, so keep its pool.
+        if profile == 'performance' and not _is_memory_sqlite(url):
+            options.update(SQLITE_PERFORMANCE_ENGINE if is_sqlite else SERVER_PERFORMANCE_ENGINE)
+            options['poolclass'] = TimedQueuePool
+        options.update(engine_options)
+
+        self.engine = create_engine(db_url, echo=echo, **options)
+        if profile == 'performance' and is_sqlite:
+            event.listen(self.engine, 'connect', _apply_sqlite_pragmas)
         self.Session = sessionmaker(bind=self.engine)
         self.Base.metadata.create_all(self.engine)
+
+        read_url = read_url or os.getenv('DATABASE_READ_URL')
+        if read_url:
+            self.read_engine = create_engine(read_url, echo=echo, **options)
+        elif is_sqlite and not _is_memory_sqlite(url):
+            # Autocommit: a query-only connection has nothing to commit or roll
+            # back, so no BEGIN/ROLLBACK is sent for read sessions at all.
+            self.read_engine = create_engine(db_url, echo=echo, **{**options, 'isolation_level': 'AUTOCOMMIT'})
+            event.listen(self.read_engine, 'connect', _apply_sqlite_read_pragmas)
+            if profile == 'performance':
+                event.listen(self.read_engine, 'connect', _apply_sqlite_read_performance_pragmas)
+        else:
+            self.read_engine = self.engine
+        self.ReadSession = sessionmaker(bind=self.read_engine, autoflush=False)
+        if self.query_stats is not None:
+            self.query_stats.attach(self.engine)
+            if self.read_engine is not self.engine:
+                self.query_stats.attach(self.read_engine)
         return self.Session
 
+    def set_async_session(self, database_url=None, echo=False, **engine_options):
+        """
+        Initialize an async engine and session factory for ``async_session_scope``.
+
+        A plain ``sqlite://`` URL is switched to the aiosqlite driver. Tables are
+        not created here; await ``create_all_async()`` for that.
+
+        Args:
+            database_url (str): Database connection string.
+            echo (bool): If True, SQLAlchemy will log all SQL statements.
+            **engine_options: Extra ``create_async_engine`` arguments.
+
+        Returns:
+            async_sessionmaker: A configured async session factory.
+        """
+        url = make_url(database_url or os.getenv('DATABASE_URL', 'sqlite:///ecommerce.db'))
+        if url.drivername == 'sqlite':
+            url = url.set(drivername='sqlite+aiosqlite')
+        self.async_engine = create_async_engine(url, echo=echo, **engine_options)
+        if self.query_stats is not None:
+            self.query_stats.attach(self.async_engine.sync_engine)
+        # Keep attributes loaded after commit: async sessions cannot lazy-load them.
+        self.AsyncSession = async_sessionmaker(self.async_engine, expire_on_commit=False)
+        return self.AsyncSession
+
+    async def create_all_async(self):
+        """Create the model tables through the async engine."""
+        async with self.async_engine.begin() as conn:
+            await conn.run_sync(self.Base.metadata.create_all)
+
+    def instrument(self, slow_query_ms=100, slow_query_log=None):
+        """
+        Record every statement's time, row count and calling function.
+
+        Applies to the current engines and to those created by later
+        ``set_session``/``set_async_session`` calls. Read the results with
+        ``query_summary()`` and ``slow_queries()``.
+
+        Args:
+            slow_query_ms (float): Statements at least this slow go to the slow-query log,
+                with their ``EXPLAIN QUERY PLAN`` on SQLite.
+            slow_query_log (str): Optional file the slow-query log is appended to as JSON lines.
+
+        Returns:
+            QueryStats: The collector, which ``uninstrument()`` detaches again.
+        """
+        self.uninstrument()
+        self.query_stats = QueryStats(slow_query_ms=slow_query_ms, slow_query_log=slow_query_log)
+        for engine in self._engines():
+            self.query_stats.attach(engine)
+        return self.query_stats
+
+    def uninstrument(self):
+        """Stop recording statements (see ``instrument``)."""
+        if self.query_stats is not None:
+            for engine in self._engines():
+                self.query_stats.detach(engine)
+            self.query_stats = None
+
+    def _engines(self):
+        engines = [self.engine, self.read_engine, self.async_engine.sync_engine if self.async_engine else None]
+        return [engine for engine in dict.fromkeys(engines) if engine is not None]
+
+    def query_summary(self, sort='total_ms', limit=None):
+        """Per-fingerprint statement stats, slowest total first; empty unless instrumented."""
+        return self.query_stats.summary(sort=sort, limit=limit) if self.query_stats else []
+
+    def slow_queries(self):
+        """Recent statements over the ``instrument`` threshold, with their query plans."""
+        return self.query_stats.slow_queries() if self.query_stats else []
+
+    def pool_stats(self):
+        """Report pool occupancy and, for timed pools, checkout wait percentiles (ms)."""
+        pool = self.engine.pool
+        stats = {'pool': type(pool).__name__, 'status': pool.status()}
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+            )
+        wait_times = getattr(pool, 'wait_times', None)
+        if wait_times is not None:
+            stats['checkouts'] = wait_times.count
+            stats['wait_ms'] = {
+                f'p{q}': round(wait_times.percentile(q) * 1000, 3) if wait_times.count else None
+                for q in (50, 95, 99)
+            }
+        return stats
+
     @contextmanager
     def session_scope(self) -> Generator[SessionType, None, None]:
         """Provide a transactional scope around a series of operations."""
@@ -45,4 +266,52 @@ class DatabaseConfig:
         finally:
             session.close()
 
+    @contextmanager
+    def read_scope(self) -> Generator[SessionType, None, None]:
+        """
+        Provide a session for reads only, on the read engine (see ``set_session``).
+
+        Nothing is committed or rolled back: the session is just closed, and on
+        SQLite its query-only connection rejects any write.
+        """
+        session = self.ReadSession()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    @asynccontextmanager
+    async def async_session_scope(self) -> AsyncGenerator[AsyncSession, None]:
+        """Async twin of ``session_scope``."""
+        session = self.AsyncSession()
+        try:
+            yield session
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            print(f'Error during transaction: {e}')
+            raise
+        finally:
+            await session.close()
+
+skip_caller_file(__file__)
+
+def _apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    _apply_pragmas(dbapi_connection, SQLITE_PERFORMANCE_PRAGMAS)
+
+def _apply_sqlite_read_pragmas(dbapi_connection, connection_record):
+    _apply_pragmas(dbapi_connection, SQLITE_READ_PRAGMAS)
+
+def _apply_sqlite_read_performance_pragmas(dbapi_connection, connection_record):
+    # journal_mode is the writer's business; set it there, not on readers.
+    _apply_pragmas(dbapi_connection, {
+        name: value for name, value in SQLITE_PERFORMANCE_PRAGMAS.items() if name != 'journal_mode'
+    })
+
 db = DatabaseConfig()
\ No newline at end of file
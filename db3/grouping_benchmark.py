@@ -0,0 +1,94 @@
+"""Compare the get_user_orders_grouped implementations on a user with many orders.
+
+Usage: python grouping_benchmark.py [--orders 10000] [--items 3] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import event
+
+import crud
+import crud_cache
+from cache_metrics import deep_sizeof
+from compact_orders import CompactOrders
+from crud import add_users_bulk, add_products_bulk, add_orders_bulk, add_order_items_bulk
+from db_config import db
+
+
+def seed(orders, items_per_order, products=50):
+    add_users_bulk([('Heavy User', 'heavy@example.com')])
+    add_products_bulk((f'Product {i}', i) for i in range(1, products + 1))
+    order_ids = add_orders_bulk([1] * orders)
+    add_order_items_bulk(
+        (order_id, (order_id * 7 + n) % products + 1, n + 1)
+        for order_id in order_ids
+        for n in range(items_per_order)
+    )
+
+
+def measure(fn, repeat):
+    """Return (median seconds, statements per call) over ``repeat`` runs of fn(1).
+
+    The functions only read, so their statements run on the read engine.
+    """
+    statements = []
+
+    def count_statement(*args):
+        statements.append(1)
+
+    event.listen(db.read_engine, 'before_cursor_execute', count_statement)
+    try:
+        fn(1)  # warm-up
+        statements.clear()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn(1)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings), len(statements) / repeat
+    finally:
+        event.remove(db.read_engine, 'before_cursor_execute', count_statement)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=10_000)
+    parser.add_argument('--items', type=int, default=3, help='items per order')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.set_session(database_url=f'sqlite:///{os.path.join(tmp, "grouping.db")}')
+        seed(args.orders, args.items)
+
+        # __wrapped__ bypasses the cache so every run hits the database.
+        implementations = [
+            ('ORM rows + lazy product (crud.py)', crud.get_user_orders_grouped),
+            ('Projection (crud_cache)', crud_cache.get_user_orders_grouped.__wrapped__),
+            ('SQL JSON aggregation (crud_cache)', crud_cache.get_user_orders_grouped_json.__wrapped__),
+        ]
+        expected = crud.get_user_orders_grouped(1)
+        print(f'=== get_user_orders_grouped: {args.orders} orders x {args.items} items ===')
+        print(f"{'Implementation':<36} | {'Median (ms)':>11} | {'Statements':>10} | {'Speedup':>7}")
+        print('-' * 75)
+        baseline = None
+        for label, fn in implementations:
+            assert fn(1) == expected, f'{label} returned a different result'
+            median, statements = measure(fn, args.repeat)
+            baseline = baseline or median
+            print(f'{label:<36} | {median * 1000:>11.2f} | {statements:>10.0f} | {baseline / median:>6.2f}x')
+
+        # What one user_orders_cache entry holds, with USER_ORDERS_CACHE_COMPACT off and on.
+        print(f"\n{'Cached value':<36} | {'Size (KB)':>11}")
+        print('-' * 50)
+        for label, value in (('list of dicts', list(expected)), ('CompactOrders', CompactOrders.from_orders(expected))):
+            print(f'{label:<36} | {deep_sizeof(value) / 1024:>11.1f}')
+        db.engine.dispose()
+        db.read_engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
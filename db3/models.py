@@ -79,3 +79,24 @@ class OrderItem(Base):
         )
 
     __repr__ = __str__
+
+class ProductSales(Base):
+    """
+    Total quantity ordered per product, kept in step with order_items.
+
+    Maintained incrementally by the session events in product_sales.py, so
+    reading the best sellers is an indexed scan instead of a GROUP BY.
+    """
+    __tablename__ = 'product_sales'
+    product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    total_quantity = Column(Integer, nullable=False, default=0, index=True)
+
+    product = relationship('Product')
+
+    def to_dict(self):
+        return {'product_id': self.product_id, 'total_quantity': self.total_quantity}
+
+    def __str__(self):
+        return f'ProductSales(product_id={self.product_id}, total_quantity={self.total_quantity})'
+
+    __repr__ = __str__
@@ -0,0 +1,119 @@
+"""Keep the product_sales summary table in step with order_items.
+
+Every flush and bulk insert that touches order items adds the quantity
+deltas to product_sales on the same connection, so the summary commits or
+rolls back together with the order items themselves. When the table is
+first created in a database that already has orders, it is backfilled.
+
+Usage: python product_sales.py [database_url]   # rebuild from order_items
+"""
+import sys
+from collections import Counter
+
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from db_config import db
+from models import OrderItem, Product, ProductSales
+
+
+def _apply_deltas(connection, deltas):
+    """Add ``{product_id: quantity}`` to product_sales, creating missing rows."""
+    for product_id, quantity in deltas.items():
+        if product_id is None or not quantity:
+            continue
+        result = connection.execute(
+            update(ProductSales)
+            .where(ProductSales.product_id == product_id)
+            .values(total_quantity=ProductSales.total_quantity + quantity)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(ProductSales).values(product_id=product_id, total_quantity=quantity))
+
+
+def _current_and_previous(state, attr):
+    history = state.attrs[attr].history
+    current = (history.added or history.unchanged or [None])[0]
+    previous = history.deleted[0] if history.deleted else current
+    return current, previous
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flushed_items(session, flush_context):
+    deltas = Counter()
+    for item in session.new:
+        if isinstance(item, OrderItem):
+            deltas[item.product_id] += item.quantity or 0
+    for item in session.deleted:
+        if isinstance(item, OrderItem):
+            deltas[item.product_id] -= item.quantity or 0
+    for item in session.dirty:
+        if isinstance(item, OrderItem) and session.is_modified(item, include_collections=False):
+            state = inspect(item)
+            product_id, old_product_id = _current_and_previous(state, 'product_id')
+            quantity, old_quantity = _current_and_previous(state, 'quantity')
+            deltas[old_product_id] -= old_quantity or 0
+            deltas[product_id] += quantity or 0
+    if deltas:
+        _apply_deltas(session.connection(), deltas)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_inserted_items(orm_execute_state):
+    # Bulk INSERTs (add_order_items_bulk) bypass the unit of work, so
+    # after_flush never sees them; total them up from the parameters instead.
+    if not orm_execute_state.is_insert or orm_execute_state.bind_mapper is None:
+        return
+    if orm_execute_state.bind_mapper.class_ is not OrderItem:
+        return
+    params = orm_execute_state.parameters
+    rows = params if isinstance(params, list) else [params or {}]
+    deltas = Counter()
+    for row in rows:
+        deltas[row.get('product_id')] += row.get('quantity') or 0
+    _apply_deltas(orm_execute_state.session.connection(), deltas)
+
+
+def _backfill(connection):
+    totals = (
+        select(OrderItem.product_id, func.sum(OrderItem.quantity))
+        .where(OrderItem.product_id.is_not(None))
+        .group_by(OrderItem.product_id)
+    )
+    connection.execute(
+        insert(ProductSales).from_select([ProductSales.product_id, ProductSales.total_quantity], totals)
+    )
+
+
+@event.listens_for(db.Base.metadata, 'after_create')
+def _backfill_new_table(metadata, connection, tables=(), **kw):
+    # Listening on the metadata rather than the table guarantees order_items
+    # exists by now, whether it was created in the same create_all or before.
+    if ProductSales.__table__ in tables:
+        _backfill(connection)
+
+
+def top_products_query(limit):
+    """Select ``(product_id, name, total_quantity)`` of the ``limit`` best sellers."""
+    # Rows stay behind at 0 when a product's order items are all removed.
+    return (
+        select(ProductSales.product_id, Product.name, ProductSales.total_quantity)
+        .join(Product, Product.id == ProductSales.product_id)
+        .where(ProductSales.total_quantity > 0)
+        .order_by(ProductSales.total_quantity.desc(), ProductSales.product_id)
+        .limit(limit)
+    )
+
+
+def rebuild_product_sales():
+    """Recompute product_sales from order_items; return the number of products."""
+    with db.session_scope() as session:
+        connection = session.connection()
+        connection.execute(delete(ProductSales))
+        _backfill(connection)
+        return session.scalar(select(func.count()).select_from(ProductSales))
+
+
+if __name__ == '__main__':
+    db.set_session(database_url=sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f'Rebuilt product_sales for {rebuild_product_sales()} products.')
@@ -0,0 +1,211 @@
+"""Per-statement SQL instrumentation: timings, row counts and calling functions.
+
+QueryStats hooks an engine's cursor events, groups statements by
+fingerprint (the SQL with literals and IN lists collapsed), and keeps a
+slow-query log with each slow SELECT's ``EXPLAIN QUERY PLAN`` on SQLite.
+Enable it with ``db.instrument()`` (see db_config); it costs a stack walk
+per statement, so it is off by default.
+"""
+import json
+import os
+import re
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter, deque
+
+from sqlalchemy import event
+
+from cache_metrics import LatencyHistogram
+
+# Frames from these directories are never reported as the caller.
+_LIBRARY_DIRS = tuple(
+    os.path.normcase(os.path.abspath(path)) + os.sep
+    for path in {sysconfig.get_paths()['stdlib'], sysconfig.get_paths()['purelib'], sysconfig.get_paths()['platlib']}
+)
+_SKIPPED_FILES = {os.path.normcase(os.path.abspath(__file__))}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """Normalize SQL so executions differing only in values or IN-list length match."""
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _IN_LIST.sub('(...)', statement)
+    return _SPACE.sub(' ', statement).strip()
+
+
+def skip_caller_file(path):
+    """Never report frames from ``path`` (e.g. db_config.py) as a statement's caller."""
+    _SKIPPED_FILES.add(os.path.normcase(os.path.abspath(path)))
+
+
+def _caller():
+    """``module.function`` of the innermost application frame, e.g. 'crud_cache.get_user_orders_grouped'."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        path = os.path.normcase(os.path.abspath(filename))
+        # '<string>' etc. are functions generated by libraries (decorators, exec).
+        if not filename.startswith('<') and not path.startswith(_LIBRARY_DIRS) and path not in _SKIPPED_FILES:
+            return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'  # e.g. async sessions, whose callers live on another greenlet
+
+
+class _QueryRecord:
+    __slots__ = ('statement', 'count', 'total', 'max', 'rows', 'callers', 'latency')
+
+    def __init__(self, statement):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.callers = Counter()
+        self.latency = LatencyHistogram()
+
+
+class _CountingCursor:
+    """DBAPI cursor proxy that adds the rows fetched through it to a _QueryRecord."""
+
+    def __init__(self, cursor, record):
+        self._cursor = cursor
+        self._record = record
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._record.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._record.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._record.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._record.rows += 1
+            yield row
+
+
+class QueryStats:
+    """
+    Aggregates every statement an attached engine runs, by fingerprint.
+
+    Statements slower than ``slow_query_ms`` are also kept in a bounded
+    slow-query log (and appended as JSON lines to ``slow_query_log`` if a
+    path is given), with the query plan of SQLite SELECTs.
+    """
+    def __init__(self, slow_query_ms=100, slow_query_log=None, max_slow_queries=100):
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_log = slow_query_log
+        self._records = {}
+        self._slow = deque(maxlen=max_slow_queries)
+        self._lock = threading.Lock()
+
+    def attach(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def detach(self, engine):
+        event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_stats_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_stats_start
+        caller = _caller()
+        key = fingerprint(statement)
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                record = self._records[key] = _QueryRecord(key)
+            record.count += 1
+            record.total += elapsed
+            record.max = max(record.max, elapsed)
+            record.callers[caller] += 1
+        record.latency.observe(elapsed)
+        if cursor.description is not None:
+            # Rows are counted as the result is fetched, after this returns.
+            context.cursor = _CountingCursor(cursor, record)
+        elif cursor.rowcount is not None and cursor.rowcount >= 0:
+            record.rows += cursor.rowcount
+        if elapsed * 1000 >= self.slow_query_ms:
+            self._log_slow(conn, statement, parameters, executemany, elapsed, caller)
+
+    def _log_slow(self, conn, statement, parameters, executemany, elapsed, caller):
+        entry = {
+            'at': time.time(),
+            'ms': round(elapsed * 1000, 3),
+            'caller': caller,
+            'statement': statement,
+            'plan': self._explain(conn, statement, parameters, executemany),
+        }
+        with self._lock:
+            self._slow.append(entry)
+            if self.slow_query_log:
+                with open(self.slow_query_log, 'a') as f:
+                    f.write(json.dumps(entry, default=str) + '\n')
+
+    @staticmethod
+    def _explain(conn, statement, parameters, executemany):
+        if conn.dialect.name != 'sqlite' or executemany or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)
+            return [row[-1] for row in cursor.fetchall()]
+        except Exception as e:
+            return [f'EXPLAIN failed: {e}']
+        finally:
+            cursor.close()
+
+    def summary(self, sort='total_ms', limit=None):
+        """
+        One dict per fingerprint, largest ``sort`` first ('total_ms', 'count',
+        'mean_ms', 'max_ms' or 'rows'), with latency percentiles and the
+        functions that issued it.
+        """
+        with self._lock:
+            records = list(self._records.values())
+        rows = []
+        for record in records:
+            rows.append({
+                'statement': record.statement,
+                'count': record.count,
+                'total_ms': round(record.total * 1000, 3),
+                'mean_ms': round(record.total * 1000 / record.count, 3),
+                'max_ms': round(record.max * 1000, 3),
+                'p95_ms': round(record.latency.percentile(95) * 1000, 3),
+                'rows': record.rows,
+                'callers': dict(record.callers.most_common()),
+            })
+        rows.sort(key=lambda row: row[sort], reverse=True)
+        return rows[:limit]
+
+    def slow_queries(self):
+        """The most recent slow statements, oldest first."""
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+            self._slow.clear()
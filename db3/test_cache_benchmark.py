@@ -0,0 +1,34 @@
+import random
+from collections import Counter
+
+from cache_benchmark import WORKLOADS, SCENARIOS, run_suite, seed_dataset, summarize
+from db_config import db
+
+
+def test_workloads_stay_in_key_space():
+    for name, workload in WORKLOADS.items():
+        keys = workload(2000, 50, random.Random(1))
+        assert len(keys) == 2000
+        assert min(keys) >= 1 and max(keys) <= 50, name
+
+
+def test_zipf_and_hot_set_are_skewed():
+    zipf = Counter(WORKLOADS['zipf'](5000, 100, random.Random(1)))
+    hot = WORKLOADS['hot-set'](5000, 100, random.Random(1))
+    assert zipf[1] > zipf[10] > zipf[100]
+    assert sum(key <= 10 for key in hot) / len(hot) > 0.85
+
+
+def test_summarize_reports_median_and_ci():
+    summary = summarize([3_000_000, 1_000_000, 2_000_000], calls=10)
+    assert summary['median_ms'] == 2.0
+    assert summary['ci95_ms'][0] <= 2.0 <= summary['ci95_ms'][1]
+    assert summary['per_call_us'] == 200.0
+
+
+def test_run_suite_smoke():
+    db.set_session(database_url='sqlite:///:memory:')
+    dataset = seed_dataset(users=10, products=5, orders_per_user=2, items_per_order=2)
+    results = run_suite(list(SCENARIOS.values()), ['uniform'], dataset, calls=20, repeat=2)
+    assert {r['scenario'] for r in results} == set(SCENARIOS)
+    assert all(r['cached']['hit_rate'] > 0 for r in results)
@@ -0,0 +1,351 @@
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+
+from cache_utils import InstrumentedCache, ConcurrentInstrumentedCache, cached, depends_on, invalidate
+from cache_backends import SQLiteBackend, dumps, loads
+from cache_metrics import approx_sizeof, deep_sizeof, render_prometheus
+from cache_benchmark import compare_policies, zipf_scan_keys
+from cache_policies import POLICIES
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_invalidate_drops_dependent_entries():
+    cache = InstrumentedCache(maxsize=10, ttl=60)
+
+    @cached(cache)
+    def load(n):
+        depends_on(('numbers', n))
+        return n * 2
+
+    load(1)
+    load(2)
+    assert invalidate(('numbers', 1)) == 1
+    assert 1 not in cache
+    assert (2,) in cache
+
+
+def test_concurrent_misses_run_loader_once():
+    cache = ConcurrentInstrumentedCache(maxsize=10, ttl=60)
+    calls = []
+    release = threading.Event()
+
+    @cached(cache)
+    def load(n):
+        calls.append(n)
+        release.wait()
+        return n
+
+    threads = [threading.Thread(target=load, args=(7,)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert calls == [7]
+    stats = cache.stats()
+    assert stats['misses'] == 8
+    assert stats['coalesced'] == 7
+
+
+def test_loader_error_reaches_waiting_threads():
+    cache = ConcurrentInstrumentedCache(maxsize=10, ttl=60)
+    release = threading.Event()
+    errors = []
+
+    @cached(cache)
+    def load(n):
+        release.wait()
+        raise ValueError(n)
+
+    def call():
+        try:
+            load(1)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(errors) == 4
+    assert (1,) not in cache
+
+
+def test_cancelled_async_leader_hands_the_load_to_a_waiter():
+    cache = ConcurrentInstrumentedCache(maxsize=10, ttl=60)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'value'
+
+    async def main():
+        leader = asyncio.create_task(cache.get_or_load_async(1, load))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(cache.get_or_load_async(1, load))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == 'value'
+    assert len(calls) == 2
+    assert cache[1] == 'value'
+
+
+def test_serve_stale_while_refreshing():
+    timer = FakeTimer()
+    cache = ConcurrentInstrumentedCache(maxsize=10, ttl=60, timer=timer, serve_stale=True)
+    version = [1]
+    started, release = threading.Event(), threading.Event()
+
+    @cached(cache)
+    def load(n):
+        if version[0] > 1:
+            started.set()
+            release.wait()
+        return version[0]
+
+    assert load(1) == 1
+    timer.now = 61
+    version[0] = 2
+
+    refresher = threading.Thread(target=load, args=(1,))
+    refresher.start()
+    started.wait()
+    assert load(1) == 1
+    release.set()
+    refresher.join()
+
+    assert load(1) == 2
+    assert cache.stats()['stale_served'] == 1
+
+
+def test_l2_read_through_and_invalidation(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first = InstrumentedCache(maxsize=10, ttl=60, l2=SQLiteBackend(path, 'orders'))
+    second = InstrumentedCache(maxsize=10, ttl=60, l2=SQLiteBackend(path, 'orders'))
+    calls = []
+
+    def loader(n):
+        def load():
+            calls.append(n)
+            depends_on(('orders.user_id', n))
+            return [{'order_id': n, 'items': []}]
+        return load
+
+    first.get_or_load(1, loader(1))
+    assert second.get_or_load(1, loader(1)) == [{'order_id': 1, 'items': []}]
+    assert calls == [1]
+    assert second.stats()['l2'] == {'hits': 1, 'misses': 0, 'hit_rate': 100.0}
+    assert second.dependencies(1) == {('orders.user_id', 1)}
+
+    invalidate(('orders.user_id', 1))
+    assert first.l2.get(1) is None
+    second.get_or_load(1, loader(1))
+    assert calls == [1, 1]
+
+
+def test_sqlite_l2_purges_expired_entries_and_their_tags(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'cache.db'), 'orders', purge_interval=0)
+    rows = lambda table: backend._conn.execute(f'SELECT count(*) FROM {table}').fetchone()[0]
+    backend.set(1, 'one', [('orders.user_id', 1)], ttl=-1)
+    backend.set(2, 'two', [('orders.user_id', 2), ('products', 2)], ttl=60)  # purges key 1
+    assert backend.get(1) is None and backend.get(2) == ('two', (('orders.user_id', 2), ('products', 2)))
+    assert rows('cache_entries') == 1 and rows('cache_tags') == 2
+    backend.invalidate([('products', 2)])
+    assert backend.purge_expired() == 0
+    assert rows('cache_entries') == 0 and rows('cache_tags') == 0  # the orphaned orders.user_id tag too
+
+
+def test_l2_values_round_trip_compressed():
+    value = [{'product': 'Laptop', 'quantity': n} for n in range(100)]
+    blob = dumps(value, [('products', 1)])
+    assert blob[:1] == b'\x01'
+    assert loads(blob) == (value, (('products', 1),))
+
+
+def test_stats_split_evictions_and_latency():
+    timer = FakeTimer()
+    cache = InstrumentedCache(maxsize=2, ttl=60, timer=timer, name='numbers')
+
+    @cached(cache)
+    def load(n):
+        depends_on(('numbers', n))
+        return n
+
+    load(1)
+    load(2)
+    load(3)  # evicts 1 (LRU)
+    invalidate(('numbers', 2))
+    timer.now = 61
+    load(4)  # expires 3
+
+    stats = cache.stats()
+    assert stats['hits'] == 0
+    assert stats['evictions'] == {'expired': 1, 'lru': 1, 'invalidated': 1}
+    assert stats['size'] == 1
+    assert 'memory_bytes' not in stats  # the exact walk is opt-in
+    assert stats['bytes'] == cache.currbytes > 0 and cache.memory_bytes() > 0
+    assert stats['load_latency_ms']['count'] == 4
+    assert stats['load_latency_ms']['p50'] <= stats['load_latency_ms']['p99']
+
+
+def test_render_prometheus():
+    cache = InstrumentedCache(maxsize=2, ttl=60, name='exposed')
+    cache.get_or_load('a', lambda: 1)
+    cache.get_or_load('a', lambda: 1)
+
+    text = render_prometheus([cache])
+    assert '# TYPE cache_hits_total counter' in text
+    assert 'cache_hits_total{cache="exposed"} 1' in text
+    assert 'cache_evictions_total{cache="exposed",reason="lru"} 0' in text
+    assert 'cache_load_duration_seconds_bucket{cache="exposed",le="+Inf"} 1' in text
+    assert 'cache_load_duration_seconds_count{cache="exposed"} 1' in text
+    assert f'cache_memory_bytes{{cache="exposed"}} {cache.currbytes}' in text
+
+
+@pytest.mark.parametrize('policy', sorted(POLICIES))
+def test_policies_respect_maxsize_and_invalidation(policy):
+    cache = InstrumentedCache(maxsize=20, ttl=60, policy=policy)
+    rng = random.Random(0)
+
+    @cached(cache)
+    def load(n):
+        depends_on(('numbers', n))
+        return n
+
+    for _ in range(2000):
+        n = rng.randint(1, 100)
+        assert load(n) == n
+        assert len(cache) <= 20
+        if n % 7 == 0:
+            invalidate(('numbers', n))
+    stats = cache.stats()
+    assert stats['policy'] == policy
+    assert stats['evictions']['lru'] > 0
+    assert stats['hits'] + stats['misses'] == 2000
+
+
+@pytest.mark.parametrize('policy', sorted(POLICIES))
+def test_policies_track_reloaded_expired_keys(policy):
+    timer = FakeTimer()
+    cache = InstrumentedCache(maxsize=2, ttl=10, timer=timer, policy=policy)
+    for step in range(8):
+        timer.now = step * 6  # each key has expired by the time it is reloaded
+        cache.get_or_load(step % 2, lambda: step)
+    for key in range(2, 8):
+        assert cache.get_or_load(key, lambda: key) == key
+        assert key in cache and len(cache) <= 2
+    assert cache.stats()['evictions']['lru'] > 0
+
+
+def test_scan_resistant_policies_beat_lru_on_polluted_zipf():
+    keys = zipf_scan_keys(20_000, 200, random.Random(0))
+    hit_rates = compare_policies(keys, maxsize=50)
+    assert hit_rates['w-tinylfu'] > hit_rates['lru']
+    assert hit_rates['arc'] > hit_rates['lru']
+
+
+@pytest.mark.parametrize('cache_class', [InstrumentedCache, ConcurrentInstrumentedCache])
+def test_commit_between_load_and_store_keeps_value_out(cache_class):
+    class RacingCache(cache_class):
+        def _store(self, key, value, load):
+            invalidate(('numbers', key))  # a write commits after the loader returned
+            return super()._store(key, value, load)
+
+    cache = RacingCache(maxsize=10, ttl=60)
+
+    def load(n):
+        depends_on(('numbers', n))
+        return n
+
+    assert cache.get_or_load(1, lambda: load(1)) == 1
+    assert cache.load_many([2], lambda missing: {n: (n, {('numbers', n)}) for n in missing}) == {2: 2}
+
+    async def load_async():
+        return load(3)
+
+    assert asyncio.run(cache.get_or_load_async(3, load_async)) == 3
+    assert 1 not in cache and 2 not in cache and 3 not in cache
+
+
+def test_load_many_batches_misses_and_skips_stale_values():
+    cache = InstrumentedCache(maxsize=10, ttl=60)
+    cache.get_or_load(1, lambda: 'one')
+    batches = []
+
+    def loader(missing):
+        batches.append(missing)
+        invalidate(('numbers', 3))  # a write commits while the batch loads
+        return {n: (f'#{n}', {('numbers', n)}) for n in missing if n != 4}
+
+    assert cache.load_many([3, 1, 2, 4], loader) == {3: '#3', 1: 'one', 2: '#2'}
+    assert batches == [[3, 2, 4]]
+    assert 2 in cache and 3 not in cache and 4 not in cache
+    assert cache.dependencies(2) == {('numbers', 2)}
+    assert cache.stats()['hits'] == 1
+
+
+def test_compact_orders_expand_lazily_and_use_less_memory():
+    from compact_orders import CompactOrders
+    from cache_metrics import deep_sizeof
+    orders = [
+        {'order_id': order_id, 'items': [{'product': f'Product {n % 3}', 'quantity': n} for n in range(order_id)]}
+        for order_id in range(1, 40)
+    ]
+    packed = CompactOrders.from_orders(orders)
+
+    assert packed == orders and orders == packed
+    assert len(packed) == 39 and packed[-1] == orders[-1] and packed[2:4] == orders[2:4]
+    assert packed.names == ('Product 0', 'Product 1', 'Product 2')
+    packed[0]['items'].append('mutated')
+    assert packed[0] == orders[0]
+    assert loads(dumps(packed))[0] == packed
+    assert deep_sizeof(packed) * 5 < deep_sizeof(orders)
+
+
+@pytest.mark.parametrize('policy', ['lru', 'w-tinylfu'])
+def test_byte_budget_evicts_until_value_fits(policy):
+    page = lambda n: [{'id': i, 'product_name': f'Product {i}', 'quantity': n} for i in range(3)]
+    catalog = [{'id': i, 'name': f'Product {i}', 'price': i} for i in range(500)]
+    budget = approx_sizeof(page(0)) * 4
+    cache = InstrumentedCache(maxsize=100, ttl=60, max_bytes=budget, policy=policy)
+
+    for n in range(10):
+        cache.get_or_load(n, lambda: page(n))
+        assert cache.currbytes <= budget
+    assert len(cache) == 4
+    assert cache.stats()['bytes'] == sum(approx_sizeof(cache[key]) for key in list(cache.keys()))
+    assert cache.stats()['evictions']['lru'] == 6
+
+    assert cache.get_or_load('catalog', lambda: catalog) == catalog
+    assert 'catalog' not in cache and len(cache) == 4  # bigger than the whole budget
+    del cache[9]
+    cache.clear()
+    assert cache.stats()['bytes'] == 0
+
+
+def test_approx_sizeof_tracks_deep_sizeof():
+    rows = [{'id': i, 'product_name': f'Product {i}', 'quantity': i % 7} for i in range(2000)]
+    estimate, exact = approx_sizeof(rows), deep_sizeof(rows)
+    assert 0.7 * exact < estimate < 1.3 * exact
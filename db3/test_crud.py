@@ -1,7 +1,12 @@
 import pytest
 from sqlalchemy.future import select
-from models import Base, User, Product, Order, OrderItem
+from models import Base, User, Product, Order, OrderItem, ProductSales
 from crud import get_all_users, add_user, get_user, add_product, get_product, add_order, add_order_item, delete_user
+from crud import get_products_after, get_products_paginated, iter_products
+from crud import get_user_orders, stream_products, stream_user_orders, stream_users
+from crud import add_users_bulk, add_products_bulk, add_orders_bulk, add_order_items_bulk
+from crud import get_total_quantity_per_product
+from product_sales import rebuild_product_sales
 from db_config import db
 
 @pytest.fixture(scope='function')
@@ -102,4 +107,161 @@ def test_delete_user(test_session):
     test_session.commit()
 
     result = delete_user(user.id)
-    assert 'User 1 deleted.' == result
\ No newline at end of file
+    assert 'User 1 deleted.' == result
+
+def test_keyset_pagination(test_session):
+    user = User(name='Frank', email='frank@example.com')
+    product = Product(name='Mouse', price=25)
+    test_session.add_all([user, product])
+    test_session.commit()
+    order_id = add_order(user.id)
+    for quantity in range(1, 8):
+        add_order_item(order_id, product.id, quantity)
+
+    first = get_products_after(last_id=0, per_page=3)
+    second = get_products_after(last_id=first[-1]['id'], per_page=3)
+    assert [item['quantity'] for item in first + second] == [1, 2, 3, 4, 5, 6]
+    assert second == get_products_paginated(page=2, per_page=3)
+    assert [item['quantity'] for item in iter_products(per_page=3)] == list(range(1, 8))
+
+
+def test_stream_reads_in_batches(test_session):
+    user = User(name='Grace', email='grace@example.com')
+    products = [Product(name=f'Cable {n}', price=n) for n in range(5)]
+    test_session.add_all([user, *products])
+    test_session.commit()
+    order_id = add_order(user.id)
+    for product in products:
+        add_order_item(order_id, product.id, 2)
+
+    assert [len(batch) for batch in stream_products(batch_size=2)] == [2, 2, 1]
+    assert [user['name'] for batch in stream_users() for user in batch] == ['Grace']
+    streamed = [row for batch in stream_user_orders(user.id, batch_size=3) for row in batch]
+    assert streamed == get_user_orders(user.id)
+
+
+def test_bulk_inserts(test_session):
+    assert add_users_bulk([('Heidi', 'heidi@example.com'), ('Ivan', 'ivan@example.com')]) == '2 users added.'
+    assert add_users_bulk([('Judy', 'judy@example.com'), ('Heidi', 'heidi@example.com')]) == (
+        'One or more emails already exist; no users added.'
+    )
+    assert len(get_all_users()) == 2
+
+    add_products_bulk([('Router', 75)])
+    order_ids = add_orders_bulk([1, 2, 1], batch_size=2)
+    assert order_ids == [1, 2, 3]
+    assert add_order_items_bulk((order_id, 1, 1) for order_id in order_ids) == '3 order items added.'
+    assert len(get_user_orders(1)) == 2
+
+
+def test_product_sales_follows_order_items(test_session):
+    add_user('Kim', 'kim@example.com')
+    add_product('Laptop', 1200)
+    add_product('Phone', 700)
+    order_id = add_order(1)
+    add_order_item(order_id, 1, 2)
+    add_order_items_bulk([(order_id, 2, 3), (order_id, 2, 4)])
+    assert get_total_quantity_per_product() == [
+        {'product': 'Phone', 'total_quantity': 7},
+        {'product': 'Laptop', 'total_quantity': 2},
+    ]
+
+    item = test_session.get(OrderItem, 1)
+    item.product_id, item.quantity = 2, 1
+    test_session.delete(test_session.get(OrderItem, 3))
+    test_session.commit()
+    test_session.add(OrderItem(order_id=order_id, product_id=1, quantity=50))
+    test_session.flush()
+    test_session.rollback()
+
+    totals = {row.product_id: row.total_quantity for row in test_session.execute(select(ProductSales)).scalars()}
+    assert totals == {1: 0, 2: 4}
+    assert get_total_quantity_per_product() == [{'product': 'Phone', 'total_quantity': 4}]  # not Laptop at 0
+    test_session.execute(ProductSales.__table__.delete())
+    test_session.commit()
+    assert rebuild_product_sales() == 1
+    assert get_total_quantity_per_product(limit=1) == [{'product': 'Phone', 'total_quantity': 4}]
+
+
+def test_product_sales_backfilled_when_created(tmp_path):
+    url = f'sqlite:///{tmp_path / "legacy.db"}'
+    db.set_session(database_url=url)
+    add_user('Lee', 'lee@example.com')
+    add_product('Router', 75)
+    add_order_item(add_order(1), 1, 3)
+    ProductSales.__table__.drop(db.engine)
+    db.engine.dispose()
+
+    db.set_session(database_url=url)
+    assert get_total_quantity_per_product() == [{'product': 'Router', 'total_quantity': 3}]
+    db.engine.dispose()
+
+
+def test_query_instrumentation(tmp_path):
+    import json
+    log = tmp_path / 'slow.jsonl'
+    db.instrument(slow_query_ms=0, slow_query_log=str(log))
+    try:
+        db.set_session(database_url='sqlite:///:memory:')
+        add_users_bulk([('Nia', 'nia@example.com'), ('Omar', 'omar@example.com')])
+        get_user(1)
+        get_user(2)
+        assert len(get_all_users()) == 2
+
+        summary = {row['statement']: row for row in db.query_summary()}
+        by_id = summary['SELECT users.id, users.name, users.email FROM users WHERE users.id = ?']
+        assert by_id['count'] == 2 and by_id['rows'] == 2
+        assert by_id['callers'] == {'crud.get_user': 2}
+        assert summary['SELECT users.id, users.name, users.email FROM users']['rows'] == 2
+        assert summary['INSERT INTO users (name, email) VALUES (...)']['rows'] == 2
+
+        slow = [entry for entry in db.slow_queries() if entry['caller'] == 'crud.get_user']
+        assert slow[0]['plan'] == ['SEARCH users USING INTEGER PRIMARY KEY (rowid=?)']
+        assert len(log.read_text().splitlines()) == len(db.slow_queries())
+        assert json.loads(log.read_text().splitlines()[-1])['caller'] == 'crud.get_all_users'
+    finally:
+        db.uninstrument()
+    assert db.query_summary() == []
+
+
+def test_read_scope_uses_query_only_connections(tmp_path):
+    from sqlalchemy.exc import OperationalError
+    db.set_session(database_url=f'sqlite:///{tmp_path / "reads.db"}')
+    assert db.read_engine is not db.engine
+    add_user('Pat', 'pat@example.com')
+    assert get_user(1)['name'] == 'Pat'  # committed writes are visible to readers
+
+    with pytest.raises(OperationalError, match='readonly'):
+        with db.read_scope() as session:
+            session.add(User(name='Quinn', email='quinn@example.com'))
+            session.flush()
+    assert [user['name'] for user in get_all_users()] == ['Pat']
+    db.engine.dispose()
+    db.read_engine.dispose()
+
+
+def test_performance_profile(tmp_path):
+    db.set_session(database_url=f'sqlite:///{tmp_path / "perf.db"}', profile='performance')
+    add_user('Mallory', 'mallory@example.com')
+
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert conn.exec_driver_sql('PRAGMA synchronous').scalar() == 1  # NORMAL
+    stats = db.pool_stats()
+    assert stats['size'] == 10
+    assert stats['checkouts'] >= 2
+    db.engine.dispose()
+
+
+def test_pool_wait_times_leave_out_connecting(tmp_path):
+    import time
+    from sqlalchemy import event
+    db.set_session(database_url=f'sqlite:///{tmp_path / "perf.db"}', profile='performance')
+    event.listen(db.engine, 'connect', lambda *args: time.sleep(0.2))
+    checkouts = db.pool_stats()['checkouts']
+    with db.engine.connect(), db.engine.connect():  # two new connections
+        pass
+    stats = db.pool_stats()
+    assert stats['checkouts'] == checkouts + 2
+    assert stats['wait_ms']['p99'] < 100
+    db.engine.dispose()
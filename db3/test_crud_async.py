@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+import crud_async
+import crud_cache_async
+from crud_cache import user_orders_cache
+from db_config import db
+
+
+@pytest.fixture(scope='function')
+def async_db(tmp_path):
+    """Set up an isolated aiosqlite database file for each test."""
+    db.set_async_session(database_url=f'sqlite:///{tmp_path / "async.db"}')
+    asyncio.run(db.create_all_async())
+    user_orders_cache.clear()
+    yield db
+    asyncio.run(db.async_engine.dispose())
+
+
+def test_async_crud(async_db):
+    async def scenario():
+        assert await crud_async.add_user('Alice', 'alice@example.com') == "User 'Alice' added."
+        assert await crud_async.add_user('Alice', 'alice@example.com') == (
+            "User with email 'alice@example.com' already exists."
+        )
+        await crud_async.add_product('Laptop', 1200)
+        order_id = await crud_async.add_order(1)
+        await crud_async.add_order_item(order_id, 1, 2)
+        assert await crud_async.get_user(1) == {'id': 1, 'name': 'Alice', 'email': 'alice@example.com'}
+        assert await crud_async.get_user_orders_grouped(1) == [
+            {'order_id': 1, 'items': [{'product': 'Laptop', 'quantity': 2}]}
+        ]
+        assert await crud_async.get_products_after(0) == await crud_async.get_products_paginated(1)
+
+    asyncio.run(scenario())
+
+
+def test_async_cached_loads_once_and_invalidates(async_db):
+    async def scenario():
+        await crud_async.add_user('Bob', 'bob@example.com')
+        await crud_async.add_product('Phone', 700)
+        order_id = await crud_async.add_order(1)
+        await crud_async.add_order_item(order_id, 1, 1)
+
+        results = await asyncio.gather(*(crud_cache_async.get_user_orders_grouped(1) for _ in range(5)))
+        assert all(result == results[0] for result in results)
+        assert user_orders_cache.stats()['load_latency_ms']['count'] == 1
+
+        await crud_cache_async.add_order_item(order_id, 1, 4)
+        assert 1 not in user_orders_cache
+        orders = await crud_cache_async.get_user_orders_grouped(1)
+        assert [item['quantity'] for item in orders[0]['items']] == [1, 4]
+
+    user_orders_cache.reset_stats()
+    asyncio.run(scenario())
+
+
+def test_async_and_sync_user_order_queries_match():
+    # Both fill the same user_orders_cache keys, so they must order items alike.
+    import crud_cache
+    assert str(crud_async._user_order_rows(1)) == str(crud_cache._user_order_rows(1))
@@ -0,0 +1,274 @@
+import pytest
+from models import User, Product, Order, OrderItem
+from crud_cache import (
+    product_cache, user_orders_cache, record_cache, id_filters, add_product, add_order_item, get_all_products,
+    get_products_paginated, get_total_quantity_per_product, get_user_orders_grouped,
+)
+from db_config import db
+
+@pytest.fixture(scope='function')
+def test_session():
+    """Set up an isolated in-memory database with two users' orders for each test."""
+    Session = db.set_session(database_url='sqlite:///:memory:')
+    session = Session()
+    session.add_all([
+        User(name='Alice', email='alice@example.com'),
+        User(name='Bob', email='bob@example.com'),
+        Product(name='Laptop', price=1200),
+        Product(name='Phone', price=700),
+    ])
+    session.flush()
+    session.add_all([Order(user_id=1), Order(user_id=2)])
+    session.flush()
+    session.add_all([
+        OrderItem(order_id=1, product_id=1, quantity=1),
+        OrderItem(order_id=1, product_id=2, quantity=2),
+        OrderItem(order_id=2, product_id=2, quantity=3),
+    ])
+    session.commit()
+    product_cache.clear()
+    product_cache.reset_stats()
+    user_orders_cache.clear()
+    record_cache.clear()
+    record_cache.reset_stats()
+    for id_filter in id_filters.values():
+        id_filter.reset()
+    yield session
+    session.close()
+
+
+def test_add_order_item_invalidates_only_that_user(test_session):
+    get_user_orders_grouped(1)
+    get_user_orders_grouped(2)
+
+    add_order_item(2, 1, 5)
+
+    assert 1 in user_orders_cache
+    assert 2 not in user_orders_cache
+    assert get_user_orders_grouped(2)[0]['items'][-1] == {'product': 'Laptop', 'quantity': 5}
+
+
+def test_add_product_keeps_order_item_entries(test_session):
+    get_all_products()
+    get_total_quantity_per_product()
+    get_products_paginated(page=1, per_page=2)
+
+    add_product('Tablet', 450)
+
+    assert len(get_all_products()) == 3
+    assert product_cache.stats()['misses'] == 4
+    assert 'page:1_per_page:2' in product_cache
+    assert get_total_quantity_per_product() == [
+        {'product': 'Phone', 'total_quantity': 5},
+        {'product': 'Laptop', 'total_quantity': 1},
+    ]
+    assert product_cache.stats()['misses'] == 4
+
+
+def test_insert_only_drops_partial_page(test_session):
+    get_products_paginated(page=1, per_page=2)
+    get_products_paginated(page=2, per_page=2)
+
+    add_order_item(1, 1, 1)
+
+    assert 'page:1_per_page:2' in product_cache
+    assert 'page:2_per_page:2' not in product_cache
+    assert len(get_products_paginated(page=2, per_page=2)) == 2
+
+
+def test_product_update_drops_dependent_entries(test_session):
+    get_user_orders_grouped(1)
+    get_user_orders_grouped(2)
+
+    test_session.get(Product, 1).name = 'Notebook'
+    test_session.commit()
+
+    assert 1 not in user_orders_cache
+    assert 2 in user_orders_cache
+    assert get_user_orders_grouped(1)[0]['items'][0]['product'] == 'Notebook'
+
+
+def test_rollback_keeps_cache(test_session):
+    get_user_orders_grouped(1)
+
+    test_session.add(OrderItem(order_id=1, product_id=1, quantity=9))
+    test_session.flush()
+    test_session.rollback()
+
+    assert 1 in user_orders_cache
+
+
+def test_keyset_page_survives_deletes_elsewhere(test_session):
+    from crud_cache import get_products_after
+    assert [item['id'] for item in get_products_after(last_id=1, per_page=2)] == [2, 3]
+
+    test_session.delete(test_session.get(OrderItem, 1))
+    test_session.commit()
+
+    assert 'after:1_per_page:2' in product_cache
+
+
+def test_bulk_insert_invalidates_once_per_transaction(test_session):
+    from crud_cache import add_order_items_bulk, add_orders_bulk, add_products_bulk
+    get_user_orders_grouped(1)
+    get_user_orders_grouped(2)
+    get_all_products()
+
+    assert add_products_bulk([('Mouse', 25), ('Cable', 5)]) == '2 products added.'
+    assert len(get_all_products()) == 4
+    order_ids = add_orders_bulk([1, 1])
+    assert order_ids == [3, 4]
+    assert 2 in user_orders_cache
+
+    get_user_orders_grouped(1)
+    assert add_order_items_bulk([(3, 3, 1), (4, 4, 2)], batch_size=1) == '2 order items added.'
+    assert 1 not in user_orders_cache
+    assert 2 in user_orders_cache
+    assert len(get_user_orders_grouped(1)) == 3
+
+
+def test_grouped_json_matches_projection(test_session):
+    from crud_cache import get_user_orders_grouped_json
+    for user_id in (1, 2, 3):
+        assert get_user_orders_grouped_json(user_id) == get_user_orders_grouped(user_id)
+
+    test_session.get(Product, 2).name = 'Smartphone'
+    test_session.commit()
+
+    assert ('json', 1) not in user_orders_cache
+    assert get_user_orders_grouped_json(1)[0]['items'][1]['product'] == 'Smartphone'
+
+
+def test_warm_up_reloads_snapshot_in_batches(test_session, tmp_path, statements):
+    from cache_warmup import ready, save_snapshot, warm_up
+    from crud_cache import get_user_orders_grouped_json
+    for user_id in (2, 1, 2, 3):
+        get_user_orders_grouped(user_id)
+    get_user_orders_grouped_json(1)
+    get_all_products()
+    get_products_paginated(page=2, per_page=2)
+    expected = {user_id: get_user_orders_grouped(user_id) for user_id in (1, 2, 3)}
+
+    path = tmp_path / 'snapshot.json'
+    assert save_snapshot(path, [product_cache, user_orders_cache]) == {'product_cache': 2, 'user_orders_cache': 4}
+    assert user_orders_cache.hot_keys(1) == [2]
+    for cache in (product_cache, user_orders_cache):
+        cache.clear()
+        cache.reset_stats()
+
+    del statements[:]
+    report = warm_up(path)
+    assert ready.is_set()
+    assert report['user_orders_cache']['loaded'] == 4
+    assert report['product_cache']['loaded'] == 2
+    assert len(statements) == 1 + 3  # one IN query for all users; two product queries + a selectin load
+    assert user_orders_cache.stats()['misses'] == 4
+
+    for user_id in (1, 2, 3):
+        assert get_user_orders_grouped(user_id) == expected[user_id]
+    assert get_user_orders_grouped_json(1) == expected[1]
+    assert 'page:2_per_page:2' in product_cache
+    assert user_orders_cache.stats()['hits'] == 4
+
+    add_order_item(2, 1, 5)
+    assert 2 not in user_orders_cache
+    assert 1 in user_orders_cache
+
+
+def test_get_user_orders_grouped_many(test_session):
+    from sqlalchemy import event
+    from crud_cache import get_user_orders_grouped_many
+    expected = {user_id: get_user_orders_grouped.__wrapped__(user_id) for user_id in (1, 2, 3)}
+    get_user_orders_grouped(2)
+
+    statements = []
+    count_statement = lambda *args: statements.append(1)
+    event.listen(db.engine, 'before_cursor_execute', count_statement)
+    assert get_user_orders_grouped_many([3, 2, 1, 3]) == {3: expected[3], 2: expected[2], 1: expected[1]}
+    assert len(statements) == 1
+    assert get_user_orders_grouped_many([1, 2, 3]) == expected
+    assert len(statements) == 1
+    event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+    add_order_item(1, 2, 4)
+    assert 1 not in user_orders_cache and 2 in user_orders_cache and 3 in user_orders_cache
+    assert get_user_orders_grouped_many([1])[1] == get_user_orders_grouped.__wrapped__(1)
+
+
+def test_warm_up_survives_a_failing_warmer(tmp_path, monkeypatch):
+    import json
+    from cache_warmup import SNAPSHOT_VERSION, _warmers, ready, warm_up
+
+    def fail(keys):
+        raise RuntimeError('database down')
+
+    warmed = []
+
+    def warm(keys):
+        warmed.extend(keys)
+        return len(keys)
+
+    monkeypatch.setitem(_warmers, 'failing_cache', fail)
+    monkeypatch.setitem(_warmers, 'other_cache', warm)
+    path = tmp_path / 'snapshot.json'
+    path.write_text(json.dumps({
+        'version': SNAPSHOT_VERSION, 'caches': {'failing_cache': ['1'], 'other_cache': ['2', '3']},
+    }))
+    ready.clear()
+    report = warm_up(path)
+    assert ready.is_set()
+    assert report['failing_cache']['error'] == 'RuntimeError: database down'
+    assert report['other_cache']['loaded'] == 2 and warmed == [2, 3]
+
+
+@pytest.fixture
+def statements():
+    """The statements run on the engine during the test, one entry each."""
+    from sqlalchemy import event
+    statements = []
+    count_statement = lambda *args: statements.append(1)
+    event.listen(db.engine, 'before_cursor_execute', count_statement)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+
+def test_missing_ids_are_cached_as_none(test_session, statements):
+    from crud_cache import add_user, get_user, delete_user
+    assert get_user(1)['name'] == 'Alice'
+    assert get_user(99) is None
+    assert get_user(1)['name'] == 'Alice' and get_user(99) is None
+    assert len(statements) == 2
+
+    add_user('Carol', 'carol@example.com')  # id 3
+    assert get_user(3)['name'] == 'Carol'
+    delete_user(1)
+    assert get_user(1) is None
+
+
+def test_missing_ids_cached_as_none_see_bulk_inserts(test_session):
+    from crud_cache import add_user, add_users_bulk, get_user, record_cache
+    assert get_user(3) is None and get_user(4) is None
+    add_user('Carol', 'carol@example.com')  # id 3; other ids stay cached
+    assert ('users', 3) not in record_cache and ('users', 4) in record_cache
+    add_users_bulk([('Dave', 'dave@example.com'), ('Erin', 'erin@example.com')])  # ids 4 and 5
+    assert get_user(4)['name'] == 'Dave' and get_user(5)['name'] == 'Erin'
+
+
+def test_id_filter_answers_missing_ids_without_queries(test_session, monkeypatch, statements):
+    from crud_cache import add_products_bulk, get_product, delete_product
+    for id_filter in id_filters.values():
+        monkeypatch.setattr(id_filter, 'enabled', True)
+    assert get_product(1)['name'] == 'Laptop'
+    assert len(statements) == 2  # load the bitmap, then the product
+    assert [get_product(product_id) for product_id in (0, 3, 10**9, -1)] == [None, None, None, None]
+    assert len(statements) == 3  # only -1 cannot be ruled out by the bitmap
+    assert id_filters['products'].rejected == 3
+
+    add_product('Tablet', 450)
+    assert get_product(3)['name'] == 'Tablet'
+    delete_product(2)
+    del statements[:]
+    assert get_product(2) is None
+    assert statements == []
+    add_products_bulk([('Mouse', 25)])
+    assert get_product(4)['name'] == 'Mouse'
@@ -1,12 +1,7 @@
-from crud import get_products_paginated
-
-def view_all_products(per_page=10):
-    page = 1
-    while True:
-        products = get_products_paginated(page=page, per_page=per_page)
-        if not products:
-            break  # No more products to show
-        print(f'Page {page}:')
-        for product in products:
-            print(product)
-        page += 1
\ No newline at end of file
+from crud import iter_products
+
+def view_all_products(per_page=10):
+    for index, product in enumerate(iter_products(per_page=per_page)):
+        if index % per_page == 0:
+            print(f'Page {index // per_page + 1}:')
+        print(product)
@@ -2,9 +2,38 @@
 import sqlite3
 import pandas as pd
 from abc import ABC, abstractmethod
+from .rolling import RollingBollinger
+from .timeseries_cache import DATE_DTYPE
+
+def _with_appended_points(name):
+    """
+    Attribute backed by self._<name> that first folds in the points buffered
+    by add_time_series_point, so the frames are only rebuilt when read.
+    """
+    attribute = '_' + name
+
+    def get(self):
+        self._flush_appended_points()
+        return getattr(self, attribute)
+
+    def set(self, value):
+        self._flush_appended_points()
+        setattr(self, attribute, value)
+
+    return property(get, set)
 
 class Company(ABC):
+    # Set to a TimeSeriesCache to read time series from its columnar files instead of SQLite
+    time_series_cache = None
+
+    time_series = _with_appended_points('time_series')
+    moving_average = _with_appended_points('moving_average')
+    high_bollinger = _with_appended_points('high_bollinger')
+    low_bollinger = _with_appended_points('low_bollinger')
+
     def __init__(self, company_id, ticker, name):
+        # (date, value, moving_average, high_bollinger, low_bollinger) per appended point
+        self._appended_points = []
         self.company_id = company_id
         self.ticker = ticker
         self.name = name
@@ -13,16 +42,51 @@ class Company(ABC):
         self.low_bollinger = None
         self.moving_average = None
         self.grade = None
+        self.window_size = 20
+        self.bollinger_width = 2
+        self.rolling_bollinger = None
+
+    def load_time_series(self, conn, start_date=None, end_date=None, last_n=None):
+        """
+        Loads the company's TimeSeries, oldest first.
+
+        start_date and end_date (inclusive) limit it to a date range, and
+        last_n to the latest n points of that range, e.g. last_n=window_size
+        for grading. Both are served by the (company_id, date) index, so the
+        rows read do not grow with the length of the history.
+
+        If time_series_cache is set and holds the company, the points are read
+        from its memory-mapped files instead, without a query or date parsing.
+        """
+        if self.time_series_cache is not None:
+            time_series = self.time_series_cache.load(self.company_id, start_date, end_date, last_n)
+            if time_series is not None:
+                self.time_series = time_series
+                self.rolling_bollinger = None
+                return
 
-    def load_time_series(self, conn):
-        query = '''
-        SELECT date, value
+        conditions = ['company_id = ?']
+        params = [self.company_id]
+        if start_date is not None:
+            conditions.append('date >= ?')
+            params.append(pd.Timestamp(start_date).strftime('%Y-%m-%d'))
+        if end_date is not None:
+            conditions.append('date <= ?')
+            params.append(pd.Timestamp(end_date).strftime('%Y-%m-%d'))
+        query = f'''
+        SELECT id, date, value
         FROM TimeSeries
-        WHERE company_id = ?
-        ORDER BY date
+        WHERE {' AND '.join(conditions)}
         '''
-        self.time_series = pd.read_sql_query(query, conn, params=(self.company_id,))
-        self.time_series['date'] = pd.to_datetime(self.time_series['date'])
+        if last_n is not None:
+            # Walk the index backwards for the latest points, then put them back in date order
+            query = f'SELECT * FROM ({query} ORDER BY date DESC, id DESC LIMIT ?)'
+            params.append(last_n)
+        query = f'SELECT date, value FROM ({query}) ORDER BY date, id'
+        self.time_series = pd.read_sql_query(query, conn, params=params, dtype={'value': 'float64'})
+        # astype keeps the dtypes the same when no rows match, as in the cache
+        self.time_series['date'] = pd.to_datetime(self.time_series['date']).astype(DATE_DTYPE)
+        self.rolling_bollinger = None
 
     def calculate_bollinger_bands(self, window_size=20, bollinger_width=2):
         rolling_mean = self.time_series['value'].rolling(window_size).mean()
@@ -30,15 +94,72 @@ class Company(ABC):
         self.moving_average = rolling_mean
         self.high_bollinger = rolling_mean + (rolling_std * bollinger_width)
         self.low_bollinger = rolling_mean - (rolling_std * bollinger_width)
+        self.window_size = window_size
+        self.bollinger_width = bollinger_width
+        self.rolling_bollinger = None
+
+    def add_time_series_point(self, date, value, conn=None):
+        """
+        Appends one point and updates the bands and grade incrementally.
+
+        The window's running mean and variance are updated in O(1) by
+        RollingBollinger instead of recomputing the rolling statistics over the
+        whole history, and the point is buffered rather than appended to the
+        frames: time_series and the band Series take in all buffered points
+        at once, the next time they are read. The bands are calculated first
+        with the current window size and width if calculate_bollinger_bands
+        has not been called. If conn is given, the point is also inserted
+        into TimeSeries.
+        """
+        if self._time_series is None:
+            raise ValueError(f'Load the time series of {self.ticker} before adding points to it.')
+        if self._moving_average is None:
+            self.calculate_bollinger_bands(self.window_size, self.bollinger_width)
+        if self.rolling_bollinger is None:
+            self.rolling_bollinger = RollingBollinger(
+                self.window_size, self.bollinger_width, self.time_series['value'].iloc[-self.window_size:]
+            )
+        self.rolling_bollinger.add(value)
+        moving_average, high_bollinger, low_bollinger = self.rolling_bollinger.bands()
+
+        date = pd.Timestamp(date)
+        self._appended_points.append((date, value, moving_average, high_bollinger, low_bollinger))
+        self.grade = self._grade(value, high_bollinger, low_bollinger)
+
+        if conn is not None:
+            conn.execute(
+                'INSERT INTO TimeSeries (company_id, value, date) VALUES (?, ?, ?)',
+                (self.company_id, value, date.strftime('%Y-%m-%d')),
+            )
+            conn.commit()
+
+    def _flush_appended_points(self):
+        if not self._appended_points:
+            return
+        points, self._appended_points = self._appended_points, []
+        dates, values, moving_averages, high_bollingers, low_bollingers = zip(*points)
+        appended = pd.DataFrame({'date': pd.to_datetime(list(dates)).astype(DATE_DTYPE), 'value': values})
+        self._time_series = pd.concat([self._time_series, appended], ignore_index=True)
+        for attribute, band in (
+            ('_moving_average', moving_averages),
+            ('_high_bollinger', high_bollingers),
+            ('_low_bollinger', low_bollingers),
+        ):
+            series = getattr(self, attribute)
+            setattr(self, attribute, pd.concat([series, pd.Series(band, name=series.name)], ignore_index=True))
+
+    @staticmethod
+    def _grade(latest_value, high_bollinger, low_bollinger):
+        if latest_value > high_bollinger:
+            return 'A'
+        elif latest_value < low_bollinger:
+            return 'C'
+        else:
+            return 'B'
 
     def assign_grade(self):
         latest_value = self.time_series['value'].iloc[-1]
-        if latest_value > self.high_bollinger.iloc[-1]:
-            self.grade = 'A'
-        elif latest_value < self.low_bollinger.iloc[-1]:
-            self.grade = 'C'
-        else:
-            self.grade = 'B'
+        self.grade = self._grade(latest_value, self.high_bollinger.iloc[-1], self.low_bollinger.iloc[-1])
 
     def display(self):
         print(f'Company: {self.name} ({self.ticker})')
@@ -46,6 +167,26 @@ class Company(ABC):
         print('Time Series Tail:')
         print(self.time_series.tail())
 
+    def summary(self):
+        """
+        Returns the grade and the latest band values as plain data, for callers
+        that collect results instead of printing them with display().
+        """
+        latest = self.time_series.iloc[-1]
+        return {
+            'company_id': self.company_id,
+            'ticker': self.ticker,
+            'name': self.name,
+            'company_type': str(getattr(self, 'company_type', '')),
+            'grade': self.grade,
+            'points': len(self.time_series),
+            'date': latest['date'].strftime('%Y-%m-%d'),
+            'value': float(latest['value']),
+            'moving_average': float(self.moving_average.iloc[-1]),
+            'high_bollinger': float(self.high_bollinger.iloc[-1]),
+            'low_bollinger': float(self.low_bollinger.iloc[-1]),
+        }
+
     def run_analysis_pipeline(self, conn):
         self.pre_pipeline()
         self.load_time_series(conn)
@@ -0,0 +1,107 @@
+# company\batch.py
+import numpy as np
+import pandas as pd
+
+GRADE_COLUMNS = ['company_id', 'grade', 'date', 'value', 'moving_average', 'high_bollinger', 'low_bollinger']
+
+
+def load_all_time_series(conn, last_n=None):
+    """
+    Loads the TimeSeries of every company with a single query.
+
+    With last_n, only each company's latest last_n points are read, through
+    the (company_id, date) index, instead of the whole history.
+
+    Returns:
+        pd.DataFrame: company_id, date and value, sorted by company and date.
+    """
+    if last_n is None:
+        query = '''
+        SELECT company_id, date, value
+        FROM TimeSeries
+        ORDER BY company_id, date, id
+        '''
+        params = ()
+    else:
+        query = '''
+        SELECT t.company_id, t.date, t.value
+        FROM companies c
+        JOIN TimeSeries t ON t.id IN (
+            SELECT id
+            FROM TimeSeries
+            WHERE company_id = c.id
+            ORDER BY date DESC, id DESC
+            LIMIT ?
+        )
+        ORDER BY t.company_id, t.date, t.id
+        '''
+        params = (last_n,)
+    time_series = pd.read_sql_query(query, conn, params=params)
+    time_series['date'] = pd.to_datetime(time_series['date'])
+    return time_series
+
+
+def calculate_bollinger_bands(time_series, window_size=20, bollinger_width=2):
+    """
+    Adds moving_average, high_bollinger and low_bollinger columns for all companies at once.
+
+    The rolling window runs over the whole frame in one pass; rows whose window
+    would reach back into the previous company (the first window_size - 1 rows
+    of each company) are set to NaN, which gives the same bands as
+    Company.calculate_bollinger_bands on each company separately.
+    """
+    position = time_series.groupby('company_id').cumcount().to_numpy()
+    complete = position >= window_size - 1
+    rolling = time_series['value'].rolling(window_size)
+    rolling_mean = rolling.mean().where(complete)
+    rolling_std = rolling.std().where(complete)
+    bands = time_series.copy()
+    bands['moving_average'] = rolling_mean
+    bands['high_bollinger'] = rolling_mean + (rolling_std * bollinger_width)
+    bands['low_bollinger'] = rolling_mean - (rolling_std * bollinger_width)
+    return bands
+
+
+def assign_grades(bands):
+    """
+    Grades each company on its latest value, as Company.assign_grade does.
+
+    Returns:
+        pd.DataFrame: One row per company with the GRADE_COLUMNS.
+    """
+    latest = bands.groupby('company_id', sort=False).tail(1).reset_index(drop=True)
+    latest['grade'] = np.select(
+        [latest['value'] > latest['high_bollinger'], latest['value'] < latest['low_bollinger']],
+        ['A', 'C'],
+        default='B',
+    )
+    return latest[GRADE_COLUMNS]
+
+
+def save_grades(conn, grades):
+    """
+    Writes the grades to company_grades with one executemany in a single transaction.
+    """
+    rows = grades.assign(date=grades['date'].dt.strftime('%Y-%m-%d'))
+    rows = rows.astype(object).where(rows.notna(), None)
+    with conn:
+        conn.executemany(f'''
+        INSERT OR REPLACE INTO company_grades ({', '.join(GRADE_COLUMNS)})
+        VALUES ({', '.join('?' * len(GRADE_COLUMNS))})
+        ''', rows.itertuples(index=False, name=None))
+
+
+def run_batch_grading(conn, window_size=20, bollinger_width=2, save=True):
+    """
+    Grades every company: one query to load the last window_size points of
+    each, one vectorized pass for the bands and one bulk write of the results.
+
+    Returns:
+        pd.DataFrame: The grades, one row per company that has a time series.
+    """
+    time_series = load_all_time_series(conn, last_n=window_size)
+    bands = calculate_bollinger_bands(time_series, window_size, bollinger_width)
+    grades = assign_grades(bands)
+    if save:
+        save_grades(conn, grades)
+    return grades
@@ -0,0 +1,140 @@
+# company\parallel.py
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .types import CompanyType
+from . import subclasses
+
+# Each worker process's own read-only connection, opened by _init_worker.
+_worker_conn = None
+
+
+def connect_read_only(db_path):
+    """
+    Opens a read-only connection to the SQLite file at db_path.
+
+    Returns:
+        sqlite3.Connection: A connection that cannot write to the database.
+    """
+    uri = Path(db_path).resolve().as_uri() + '?mode=ro'
+    return sqlite3.connect(uri, uri=True)
+
+
+def load_companies(conn, company_ids=None):
+    """
+    Returns:
+        list: (id, ticker, name, company_type) rows, all companies if company_ids is None.
+    """
+    query = 'SELECT id, ticker, name, company_type FROM companies'
+    params = ()
+    if company_ids is not None:
+        company_ids = list(company_ids)
+        query += f' WHERE id IN ({", ".join("?" * len(company_ids))})'
+        params = company_ids
+    return conn.execute(query + ' ORDER BY id', params).fetchall()
+
+
+def analyze_company(conn, row, window_size=20, bollinger_width=2):
+    """
+    Loads the latest window_size points of one company, calculates its bands
+    and grades it, without printing anything.
+
+    Returns:
+        dict: Company.summary(), or the company's id and an 'error' message if it could not be graded.
+    """
+    company_id, ticker, name, company_type = row
+    try:
+        company = CompanyType.get_class(company_type)(company_id, ticker, name)
+        company.load_time_series(conn, last_n=window_size)
+        company.calculate_bollinger_bands(window_size, bollinger_width)
+        company.assign_grade()
+        return company.summary()
+    except Exception as e:
+        return {'company_id': company_id, 'ticker': ticker, 'error': str(e)}
+
+
+def _init_worker(db_path):
+    global _worker_conn
+    _worker_conn = connect_read_only(db_path)
+
+
+def _analyze_in_worker(row, window_size, bollinger_width):
+    return analyze_company(_worker_conn, row, window_size, bollinger_width)
+
+
+def run_serial_analysis(db_path, company_ids=None, window_size=20, bollinger_width=2):
+    """
+    Grades the companies one after another on a single connection.
+
+    Returns:
+        list: One analyze_company() result per company, ordered by id.
+    """
+    conn = connect_read_only(db_path)
+    try:
+        return [analyze_company(conn, row, window_size, bollinger_width) for row in load_companies(conn, company_ids)]
+    finally:
+        conn.close()
+
+
+def run_parallel_analysis(db_path, company_ids=None, window_size=20, bollinger_width=2, processes=None, chunksize=None):
+    """
+    Grades the companies across a process pool.
+
+    Every worker opens its own read-only connection to db_path, so nothing
+    is shared with the DatabaseConnection singleton; results come back as
+    dicts rather than display() output.
+
+    Returns:
+        list: One analyze_company() result per company, ordered by id.
+    """
+    conn = connect_read_only(db_path)
+    try:
+        rows = load_companies(conn, company_ids)
+    finally:
+        conn.close()
+    if not rows:
+        return []
+    processes = processes or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(rows) // (processes * 4))
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(str(db_path),)) as executor:
+        return list(executor.map(
+            _analyze_in_worker, rows, [window_size] * len(rows), [bollinger_width] * len(rows), chunksize=chunksize
+        ))
+
+
+def compare_throughput(db_path, company_ids=None, window_size=20, bollinger_width=2, processes=None):
+    """
+    Runs the serial and the parallel analysis and reports companies per second for each.
+
+    Returns:
+        dict: Timings and throughput of both runs, and whether their grades agree.
+    """
+    report = {}
+    results = {}
+    for mode, run in (('serial', run_serial_analysis), ('parallel', run_parallel_analysis)):
+        kwargs = {'processes': processes} if mode == 'parallel' else {}
+        start = time.perf_counter()
+        results[mode] = run(db_path, company_ids, window_size, bollinger_width, **kwargs)
+        seconds = time.perf_counter() - start
+        report[mode] = {
+            'companies': len(results[mode]),
+            'seconds': round(seconds, 3),
+            'companies_per_second': round(len(results[mode]) / seconds, 1) if seconds else None,
+        }
+    parallel_seconds = report['parallel']['seconds']
+    report['speedup'] = round(report['serial']['seconds'] / parallel_seconds, 2) if parallel_seconds else None
+    report['grades_match'] = [r.get('grade') for r in results['serial']] == [r.get('grade') for r in results['parallel']]
+    return report
+
+
+if __name__ == '__main__':
+    import sys
+    from db.connection import DatabaseConnection
+
+    path = sys.argv[1] if len(sys.argv) > 1 else DatabaseConnection._default_dir / DatabaseConnection._default_filename
+    for mode, stats in compare_throughput(path).items():
+        print(f'{mode}: {stats}')
@@ -0,0 +1,66 @@
+# company\rolling.py
+import math
+from collections import deque
+
+
+class RollingBollinger:
+    """
+    Bollinger bands over a sliding window, updated in O(1) per new value.
+
+    Keeps the window's values and the count, mean and sum of squared
+    deviations of its non-NaN values (Welford's algorithm, with the oldest
+    value taken back out as it leaves the window), so it matches pandas'
+    rolling(window_size).mean()/std() without recomputing the history. As in
+    pandas, the bands are NaN until the window is full and while it holds a
+    NaN, and recover once the NaN has left the window.
+    """
+    def __init__(self, window_size=20, bollinger_width=2, values=()):
+        self.window_size = window_size
+        self.bollinger_width = bollinger_width
+        self.window = deque()
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        for value in list(values)[-window_size:]:
+            self.add(value)
+
+    def add(self, value):
+        value = math.nan if value is None else float(value)
+        self.window.append(value)
+        if not math.isnan(value):
+            self._include(value)
+        if len(self.window) > self.window_size:
+            oldest = self.window.popleft()
+            if not math.isnan(oldest):
+                self._exclude(oldest)
+
+    def _include(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def _exclude(self, value):
+        if self.count == 1:
+            self.count, self.mean, self._m2 = 0, 0.0, 0.0
+            return
+        self.count -= 1
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self._m2 = max(self._m2 - delta * (value - self.mean), 0.0)  # rounding can push it just below zero
+
+    @property
+    def std(self):
+        if self.count < max(self.window_size, 2):
+            return math.nan
+        return math.sqrt(self._m2 / (self.count - 1))
+
+    def bands(self):
+        """
+        Returns:
+            tuple: (moving_average, high_bollinger, low_bollinger), NaN unless the window is full of numbers.
+        """
+        if self.count < self.window_size:
+            return math.nan, math.nan, math.nan
+        std = self.std
+        return self.mean, self.mean + std * self.bollinger_width, self.mean - std * self.bollinger_width
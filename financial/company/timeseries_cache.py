@@ -0,0 +1,164 @@
+# company\timeseries_cache.py
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# The dtype pd.to_datetime gives TEXT dates, so cached frames equal the SQLite ones
+DATE_DTYPE = pd.to_datetime(pd.Series(['2024-01-01'])).dtype
+
+RECORD_DTYPE = np.dtype([('date', DATE_DTYPE), ('value', 'float64'), ('id', 'int64')])
+
+
+class TimeSeriesCache:
+    """
+    Columnar copy of the TimeSeries table: one .npy record file per company.
+
+    {company_id}.npy holds the company's points as (date, value, id) records
+    in (date, id) order, like Company.load_time_series. load() memory-maps the
+    file and wraps slices of its date and value fields in a DataFrame, so
+    reading a company copies nothing and never re-parses TEXT dates. The
+    frames it returns are read-only.
+
+    refresh(conn) brings the files up to date from SQLite incrementally: it
+    reads only the rows whose id is above the highest id already cached and
+    rewrites only the companies that received them. Each company is one file
+    replaced atomically, so a concurrent load() sees either the old or the new
+    points, and rows whose id a company's file already holds are skipped, so
+    rerunning a refresh that was interrupted does not duplicate them.
+    Updates or deletes of existing rows are not seen; call rebuild(conn)
+    after those.
+    """
+    _manifest_name = 'manifest.json'
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.last_id = self._read_manifest().get('last_id', 0)
+
+    def _read_manifest(self):
+        try:
+            with open(self.directory / self._manifest_name) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_manifest(self):
+        self._replace(self.directory / self._manifest_name, lambda f: f.write(json.dumps({'last_id': self.last_id}).encode()))
+
+    @staticmethod
+    def _replace(path, write):
+        # Write beside the target and rename over it, so readers (and existing
+        # memory maps of the old file) never see a half-written file.
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def _path(self, company_id):
+        return self.directory / f'{company_id}.npy'
+
+    def __contains__(self, company_id):
+        return self._path(company_id).exists()
+
+    def _read(self, company_id):
+        return np.load(self._path(company_id), mmap_mode='r')
+
+    def _write(self, company_id, records):
+        self._replace(self._path(company_id), lambda f: np.save(f, records))
+
+    @staticmethod
+    def _records(time_series):
+        records = np.empty(len(time_series), dtype=RECORD_DTYPE)
+        records['date'] = pd.to_datetime(time_series['date']).to_numpy().astype(DATE_DTYPE)
+        records['value'] = time_series['value'].to_numpy()
+        records['id'] = time_series['id'].to_numpy()
+        return records
+
+    def load(self, company_id, start_date=None, end_date=None, last_n=None):
+        """
+        Reads one company with the same options as Company.load_time_series.
+
+        Returns:
+            pd.DataFrame: date and value columns backed by the memory-mapped
+            file, or None if the company is not cached.
+        """
+        try:
+            records = self._read(company_id)
+        except FileNotFoundError:
+            return None
+        dates = records['date']
+        start, stop = 0, len(records)
+        if start_date is not None:
+            start = np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date).normalize()), side='left')
+        if end_date is not None:
+            end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+            stop = np.searchsorted(dates, np.datetime64(end), side='left')
+        if last_n is not None:
+            start = max(start, stop - last_n)
+        start = min(start, stop)
+        return pd.DataFrame({'date': dates[start:stop], 'value': records['value'][start:stop]}, copy=False)
+
+    def refresh(self, conn):
+        """
+        Appends the TimeSeries rows added since the last refresh.
+
+        A company whose new rows all sort after its cached ones gets them
+        appended; one that received older dates is reloaded whole from SQLite.
+
+        Returns:
+            int: The number of new rows read.
+        """
+        query = '''
+        SELECT company_id, id, date, value
+        FROM TimeSeries
+        WHERE id > ?
+        ORDER BY company_id, date, id
+        '''
+        rows = pd.read_sql_query(query, conn, params=(self.last_id,))
+        if rows.empty:
+            return 0
+        for company_id, new in rows.groupby('company_id', sort=False):
+            company_id = int(company_id)
+            new = self._records(new)
+            if company_id in self:
+                records = self._read(company_id)
+                if len(records):
+                    new = new[new['id'] > records['id'].max()]  # already cached by an interrupted refresh
+                    if not len(new):
+                        continue
+                    if new['date'][0] < records['date'][-1]:
+                        self._rebuild_company(conn, company_id)
+                        continue
+                new = np.concatenate([records, new])
+            elif self.last_id:
+                # File missing for a company with older rows: reload it whole
+                self._rebuild_company(conn, company_id)
+                continue
+            self._write(company_id, new)
+        self.last_id = int(rows['id'].max())
+        self._write_manifest()
+        return len(rows)
+
+    def _rebuild_company(self, conn, company_id):
+        query = '''
+        SELECT id, date, value
+        FROM TimeSeries
+        WHERE company_id = ?
+        ORDER BY date, id
+        '''
+        self._write(company_id, self._records(pd.read_sql_query(query, conn, params=(company_id,))))
+
+    def rebuild(self, conn):
+        """
+        Discards the cached files and reloads every company from SQLite.
+
+        Returns:
+            int: The number of rows read.
+        """
+        for path in self.directory.glob('*.npy'):
+            path.unlink()
+        self.last_id = 0
+        return self.refresh(conn)
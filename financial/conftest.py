@@ -0,0 +1,41 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from db.create_schema import create_tables
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A database with a year of prices for five companies and two for a crypto one."""
+    path = tmp_path / 'companies.db'
+    conn = sqlite3.connect(path)
+    create_tables(conn)
+    companies = [(company_id, f'T{company_id}', f'Company {company_id}', company_type)
+                 for company_id, company_type in enumerate(['domestic', 'domestic', 'foreign', 'foreign', 'crypto'], 1)]
+    companies.append((6, 'XNEW', 'New Coin', 'crypto'))
+    conn.executemany('INSERT INTO companies (id, ticker, name, company_type) VALUES (?, ?, ?, ?)', companies)
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2024-01-01', periods=365).strftime('%Y-%m-%d')
+    for company_id in range(1, 6):
+        values = 100 + rng.normal(0, 1 + company_id, len(dates)).cumsum()
+        conn.executemany(
+            'INSERT INTO TimeSeries (company_id, value, date) VALUES (?, ?, ?)',
+            zip([company_id] * len(dates), values.tolist(), dates),
+        )
+    conn.executemany(
+        'INSERT INTO TimeSeries (company_id, value, date) VALUES (?, ?, ?)',
+        [(6, 43000.0, '2024-12-30'), (6, 43500.5, '2024-12-31')],
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
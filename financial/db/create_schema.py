@@ -1,37 +1,66 @@
 # db/create_schema.py
 from .connection import DatabaseConnection
 
-def create_tables():
-    with DatabaseConnection() as conn:
-        cursor = conn.cursor()
-
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS companies (
-            id INTEGER PRIMARY KEY,
-            ticker TEXT NOT NULL,
-            name TEXT NOT NULL,
-            company_type TEXT NOT NULL DEFAULT 'domestic'
-                CHECK (company_type IN ('domestic', 'foreign', 'crypto'))
-        )
-        ''')
-
-        cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_companies_ticker ON companies (ticker)
-        ''')
-
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS TimeSeries (
-            id INTEGER PRIMARY KEY,
-            company_id INTEGER,
-            value REAL,
-            date TEXT,
-            FOREIGN KEY (company_id) REFERENCES companies(id)
-        )
-        ''')
-
-        cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_timeseries_company_id ON TimeSeries (company_id)
-        ''')
+def create_tables(conn=None):
+    """
+    Creates the tables and indexes that do not exist yet, in the shared
+    database or, if conn is given, in that connection's database.
+    """
+    if conn is None:
+        with DatabaseConnection() as conn:
+            _create_tables(conn)
+    else:
+        _create_tables(conn)
+        conn.commit()
+
+def _create_tables(conn):
+    cursor = conn.cursor()
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS companies (
+        id INTEGER PRIMARY KEY,
+        ticker TEXT NOT NULL,
+        name TEXT NOT NULL,
+        company_type TEXT NOT NULL DEFAULT 'domestic'
+            CHECK (company_type IN ('domestic', 'foreign', 'crypto'))
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_companies_ticker ON companies (ticker)
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS TimeSeries (
+        id INTEGER PRIMARY KEY,
+        company_id INTEGER,
+        value REAL,
+        date TEXT,
+        FOREIGN KEY (company_id) REFERENCES companies(id)
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_timeseries_company_date ON TimeSeries (company_id, date)
+    ''')
+
+    # Superseded by idx_timeseries_company_date, which also serves lookups by company_id alone
+    cursor.execute('''
+    DROP INDEX IF EXISTS idx_timeseries_company_id
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS company_grades (
+        company_id INTEGER PRIMARY KEY,
+        grade TEXT NOT NULL CHECK (grade IN ('A', 'B', 'C')),
+        date TEXT,
+        value REAL,
+        moving_average REAL,
+        high_bollinger REAL,
+        low_bollinger REAL,
+        FOREIGN KEY (company_id) REFERENCES companies(id)
+    )
+    ''')
 
 if __name__ == '__main__':
     create_tables()
@@ -2,6 +2,8 @@
 from db.connection import DatabaseConnection
 from company.factory import CompanyFactory
 from company.base import Company
+from company.batch import run_batch_grading
+from db.create_schema import create_tables
 
 # Define the Bollinger Band width as a global variable
 bollinger_width = 2
@@ -106,4 +108,9 @@ try:
 except Exception as e:
     print(f'Error processing domestic company: {e}')
 
+# Grade every company in one pass and store the results in company_grades
+create_tables()
+grades = run_batch_grading(conn, window_size, bollinger_width)
+print(grades[['company_id', 'grade']].to_string(index=False))
+
 DatabaseConnection.close_connection()
\ No newline at end of file
@@ -0,0 +1,18 @@
+from company.batch import run_batch_grading
+from company.factory import CompanyFactory
+
+
+def test_batch_grades_match_per_company_pipeline(conn):
+    grades = run_batch_grading(conn, window_size=20).set_index('company_id')
+    assert len(grades) == 6
+    for company_id, row in grades.iterrows():
+        company = CompanyFactory.get_company(int(company_id), conn)
+        company.load_time_series(conn)
+        company.calculate_bollinger_bands(20)
+        company.assign_grade()
+        assert row['grade'] == company.grade
+        if company_id != 6:  # too few points for a band
+            assert abs(row['high_bollinger'] - company.high_bollinger.iloc[-1]) < 1e-9
+
+    stored = dict(conn.execute('SELECT company_id, grade FROM company_grades').fetchall())
+    assert stored == grades['grade'].to_dict()
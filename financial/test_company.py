@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from company.rolling import RollingBollinger
+from company.subclasses import DomesticCompany
+from company.timeseries_cache import DATE_DTYPE
+
+
+def make_company(values, start='2024-01-01'):
+    company = DomesticCompany(1, 'TEST', 'Test Inc.')
+    company.time_series = pd.DataFrame({
+        'date': pd.date_range(start, periods=len(values)),
+        'value': values,
+    })
+    return company
+
+
+def assert_bands_match(company, window_size, bollinger_width):
+    expected = make_company(company.time_series['value'].to_numpy())
+    expected.calculate_bollinger_bands(window_size, bollinger_width)
+    expected.assign_grade()
+    for band in ('moving_average', 'high_bollinger', 'low_bollinger'):
+        np.testing.assert_allclose(getattr(company, band), getattr(expected, band), rtol=1e-9, atol=1e-9)
+    assert company.grade == expected.grade
+
+
+@pytest.mark.parametrize('window_size', [1, 2, 20])
+def test_incremental_bands_match_full_recalculation(window_size):
+    rng = np.random.default_rng(0)
+    company = make_company(100 + rng.normal(0, 1, 30).cumsum())
+    company.calculate_bollinger_bands(window_size, 2)
+
+    values = 100 + rng.normal(0, 5, 200).cumsum()
+    for i, value in enumerate(values):
+        company.add_time_series_point(pd.Timestamp('2024-01-31') + pd.Timedelta(days=i), value)
+        if i % 50 == 0:
+            assert_bands_match(company, window_size, 2)
+    assert len(company._appended_points) == 49  # buffered until the frames are read
+    assert len(company.time_series) == 230 and not company._appended_points
+    assert_bands_match(company, window_size, 2)
+
+
+def test_incremental_bands_recover_after_nan():
+    company = make_company(np.linspace(100, 120, 25))
+    company.calculate_bollinger_bands(5, 2)
+    for i, value in enumerate([121, math.nan, 122, 123, 124, 125, 126, 127, 128]):
+        company.add_time_series_point(pd.Timestamp('2024-02-01') + pd.Timedelta(days=i), value)
+    assert not math.isnan(company.moving_average.iloc[-1])
+    assert_bands_match(company, 5, 2)
+
+
+def test_appending_before_calculating_bands_calculates_them(conn):
+    company = DomesticCompany(1, 'T1', 'Company 1')
+    with pytest.raises(ValueError, match='Load the time series'):
+        company.add_time_series_point('2025-01-01', 100.0)
+
+    company.load_time_series(conn)
+    company.add_time_series_point('2025-01-01', 100.0)
+    assert company.time_series['date'].dtype == DATE_DTYPE
+    assert company.time_series['date'].iloc[-1] == pd.Timestamp('2025-01-01')
+    assert_bands_match(company, 20, 2)
+
+
+def test_rolling_bollinger_matches_pandas_with_large_values():
+    values = pd.Series(43000 + np.random.default_rng(1).normal(0, 0.5, 500))
+    values[[10, 11, 300]] = np.nan
+    rolling = RollingBollinger(20, 2)
+    expected = values.rolling(20).mean()
+    for value, mean in zip(values, expected):
+        rolling.add(value)
+        if math.isnan(mean):
+            assert math.isnan(rolling.bands()[0])
+        else:
+            assert rolling.bands()[0] == pytest.approx(mean, rel=1e-12)
+    assert rolling.std == pytest.approx(values.rolling(20).std().iloc[-1], rel=1e-6)
+
+
+def test_windowed_loads_match_full_history(conn):
+    company = DomesticCompany(1, 'T1', 'Company 1')
+    company.load_time_series(conn)
+    full = company.time_series
+
+    company.load_time_series(conn, last_n=20)
+    assert company.time_series.equals(full.tail(20).reset_index(drop=True))
+    company.load_time_series(conn, start_date='2024-03-01', end_date='2024-03-31')
+    assert company.time_series['date'].dt.month.unique().tolist() == [3] and len(company.time_series) == 31
+    company.load_time_series(conn, end_date='2024-03-31', last_n=5)
+    assert company.time_series['date'].iloc[-1] == pd.Timestamp('2024-03-31') and len(company.time_series) == 5
+
+
+def test_last_n_loads_use_company_date_index(conn):
+    plan = conn.execute(
+        'EXPLAIN QUERY PLAN SELECT id FROM TimeSeries WHERE company_id = ? ORDER BY date DESC, id DESC LIMIT 20', (1,)
+    ).fetchall()
+    assert any('idx_timeseries_company_date' in row[-1] for row in plan)
+    assert not any('TEMP B-TREE' in row[-1] for row in plan)
@@ -0,0 +1,18 @@
+import pandas as pd
+
+from company.parallel import compare_throughput, run_parallel_analysis, run_serial_analysis
+
+
+def test_parallel_results_match_serial(db_path):
+    serial = run_serial_analysis(db_path)
+    parallel = run_parallel_analysis(db_path, processes=2)
+    assert pd.DataFrame(parallel).equals(pd.DataFrame(serial))  # NaN bands compare equal here
+    assert [result['company_id'] for result in serial] == [1, 2, 3, 4, 5, 6]
+    assert all('error' not in result for result in serial)
+    assert run_serial_analysis(db_path, company_ids=[3])[0]['ticker'] == 'T3'
+
+
+def test_compare_throughput_reports_both_paths(db_path):
+    report = compare_throughput(db_path, processes=2)
+    assert report['serial']['companies'] == report['parallel']['companies'] == 6
+    assert report['grades_match']
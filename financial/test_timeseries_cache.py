@@ -0,0 +1,83 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from company.base import Company
+from company.subclasses import DomesticCompany
+from company.timeseries_cache import TimeSeriesCache
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE TimeSeries (id INTEGER PRIMARY KEY, company_id INTEGER, value REAL, date TEXT)')
+    rng = np.random.default_rng(0)
+    for company_id in (1, 2):
+        conn.executemany(
+            'INSERT INTO TimeSeries (company_id, value, date) VALUES (?, ?, ?)',
+            [(company_id, float(value), f'2024-{1 + day // 28:02d}-{1 + day % 28:02d}')
+             for day, value in enumerate(100 + rng.normal(0, 1, 60).cumsum())],
+        )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def load(conn, company_id, cache=None, **options):
+    Company.time_series_cache = cache
+    try:
+        company = DomesticCompany(company_id, 'TEST', 'Test Inc.')
+        company.load_time_series(conn, **options)
+        return company.time_series
+    finally:
+        Company.time_series_cache = None
+
+
+def add_points(conn, points):
+    conn.executemany('INSERT INTO TimeSeries (company_id, value, date) VALUES (?, ?, ?)', points)
+    conn.commit()
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'last_n': 20},
+    {'start_date': '2024-02-01', 'end_date': '2024-02-10'},
+    {'end_date': '2024-02-10', 'last_n': 3},
+    {'start_date': '2030-01-01'},
+])
+def test_cached_frames_equal_sqlite_frames(conn, tmp_path, options):
+    cache = TimeSeriesCache(tmp_path)
+    assert cache.rebuild(conn) == 120
+    cached = load(conn, 1, cache, **options)
+    assert cached.equals(load(conn, 1, **options))
+    memory_map = cached['value'].to_numpy()
+    while not isinstance(memory_map, np.memmap):
+        memory_map = memory_map.base
+    assert memory_map is not None  # read zero-copy from the file
+
+
+def test_refresh_appends_and_reloads_backdated_companies(conn, tmp_path):
+    cache = TimeSeriesCache(tmp_path)
+    cache.refresh(conn)
+    add_points(conn, [(1, 1.5, '2024-03-05'), (2, 2.5, '2023-12-31'), (3, 3.5, '2024-01-01')])
+    assert cache.refresh(conn) == 3 and cache.refresh(conn) == 0
+    for company_id in (1, 2, 3):
+        assert load(conn, company_id, TimeSeriesCache(tmp_path)).equals(load(conn, company_id))
+
+
+def test_interrupted_refresh_does_not_duplicate_rows(conn, tmp_path, monkeypatch):
+    cache = TimeSeriesCache(tmp_path)
+    cache.refresh(conn)
+    add_points(conn, [(1, 1.5, '2024-03-05'), (2, 2.5, '2024-03-05')])
+
+    def crash():
+        raise OSError('disk full')
+
+    monkeypatch.setattr(cache, '_write_manifest', crash)
+    with pytest.raises(OSError):
+        cache.refresh(conn)  # company files written, manifest not
+    monkeypatch.undo()
+    cache.refresh(conn)
+    for company_id in (1, 2):
+        assert load(conn, company_id, cache).equals(load(conn, company_id))